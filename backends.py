@@ -1,16 +1,112 @@
+import collections
+import functools
+import os
 import string
+import tempfile
 
-from utils import load_yaml
+from utils import Memo, load_yaml
 
+# for removing punctuation from a word with str.translate
+PUNCTUATION = str.maketrans("", "", string.punctuation)
 
-class LaTeX:
+# number of characters of footnotes MARKDOWN_STREAM reads back at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# number of the most recently used footnotes MARKDOWN_STREAM remembers so
+# later words with the same entry can share them
+STREAM_FOOTNOTE_KEYS = 10000
+
+
+class BoundedMap(collections.OrderedDict):
+    """
+    dict that only keeps the max_size most recently used items, where get
+    counts as using an item.
+    """
+
+    def __init__(self, max_size):
+        super().__init__()
+        self.max_size = max_size
+
+    def get(self, key, default=None):
+        if key in self:
+            self.move_to_end(key)
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+@functools.lru_cache(maxsize=None)
+def load_settings(filename, version=None):
+    """
+    returns the backend settings in the given YAML file, loading each version
+    of each file only once per process (version being anything that changes
+    when the file does).
+    """
+    return load_yaml(filename)
+
+
+class SettingsBackend:
+    """
+    base class for backends configured by the YAML file settings_file, which
+    is loaded again if it changes.
+    """
+
+    settings_file = None
 
     def __init__(self):
-        self.settings = load_yaml("LaTeX.yaml")
+        st = os.stat(self.settings_file)
+        self.settings_version = "{}:{}:{}".format(
+            self.settings_file, st.st_size, st.st_mtime_ns)
+        self.settings = load_settings(self.settings_file, self.settings_version)
+
+    def cache_key(self):
+        """
+        returns a string identifying the version of the settings used, so
+        cached output isn't reused once they change.
+        """
+        return self.settings_version
 
     def lang_code(self, language):
         return self.settings['languages'][language]
 
+
+class VerseRenderer:
+    """
+    mixin for backends whose output for a word is its text followed by
+    something depending only on the rest of word's arguments, rendering a
+    whole verse at once and formatting what follows the text for each
+    distinct set of arguments only once.
+    """
+
+    # the output for a word depends only on its arguments
+    cacheable = True
+
+    def __init__(self):
+        super().__init__()
+        # what follows a word's text for each (headword, parse, gloss,
+        # language), so each footnote is only formatted once
+        self.suffixes = Memo(lambda key: self.word("", *key))
+
+    def render_verse(self, words):
+        """
+        returns the rendering of a verse's words given the list of arguments
+        to word for each.
+        """
+        suffixes = self.suffixes
+        try:
+            return "".join([args[0] + suffixes[args[1:]] for args in words])
+        except TypeError:  # an unhashable (e.g. list) gloss
+            return "".join([self.word(*args) for args in words])
+
+
+class LaTeX(VerseRenderer, SettingsBackend):
+
+    settings_file = "LaTeX.yaml"
+
     def preamble(self, typeface, language):
         return """
 \\documentclass[a4paper,12pt]{{scrartcl}}
@@ -23,7 +119,7 @@ class LaTeX:
 \\setotherlanguage{{{language}}}
 
 \\setromanfont{{{typeface}}}
-\\newfontfamily\greekfont[Script=Greek]{{{typeface}}}
+\\newfontfamily\\greekfont[Script=Greek]{{{typeface}}}
 \\linespread{{1.5}}
 \\onehalfspacing
 
@@ -36,11 +132,11 @@ class LaTeX:
 
     def book_chapter_verse(self, book, chapter, verse):
         return """
-\\textbf{{\Large {}.{}.{}}}~""".format(book, chapter, verse)
+\\textbf{{\\Large {}.{}.{}}}~""".format(book, chapter, verse)
 
     def chapter_verse(self, chapter, verse):
         return """
-\\textbf{{\Large {}.{}}}~""".format(chapter, verse)
+\\textbf{{\\Large {}.{}}}~""".format(chapter, verse)
 
     def verse(self, verse):
         return "\\textbf{{{}}}~".format(verse)
@@ -66,13 +162,9 @@ class LaTeX:
         return "\\end{document}"
 
 
-class SILE:
-
-    def __init__(self):
-        self.settings = load_yaml("SILE.yaml")
+class SILE(VerseRenderer, SettingsBackend):
 
-    def lang_code(self, language):
-        return self.settings['languages'][language]
+    settings_file = "SILE.yaml"
 
     def preamble(self, typeface, language):
         return """\
@@ -135,23 +227,24 @@ class MARKDOWN:
     def verse(self, verse):
         return "_{}_ ".format(verse)
 
+    def footnote_key(self, text, headword, parse, gloss):
+        # get rid of all punctuation etc for text
+        return text.translate(PUNCTUATION)
+
+    def add_footnote(self, footnote):
+        self.footnotes.append(footnote)
+
     def word(self, text, headword=None, parse=None, gloss=None, language=None):
         if headword is None and parse is None and gloss is None:
             return text + " "
         else:
-            footnote_number = None
-            found = False
-            # get rid of all punctuation etc for text
-            stripped_text = text.translate(str.maketrans('', '', string.punctuation))
-            if stripped_text in self.footnote_to_counter_map:
-                found = True
-                footnote_number = self.footnote_to_counter_map[stripped_text]
-            else:
+            key = self.footnote_key(text, headword, parse, gloss)
+            footnote_number = self.footnote_to_counter_map.get(key)
+            if footnote_number is None:
                 self.footnote_counter += 1
-                self.footnote_to_counter_map[stripped_text] = self.footnote_counter
+                self.footnote_to_counter_map[key] = self.footnote_counter
                 footnote_number = self.footnote_counter
 
-            if not found:
                 footnote = []
                 footnote.append("[^{}]: ".format(self.footnote_counter))
                 if headword:
@@ -161,7 +254,7 @@ class MARKDOWN:
                 if gloss:
                     footnote.append("– *{}*".format(gloss))
 
-                self.footnotes.append(" ".join(footnote))
+                self.add_footnote(" ".join(footnote))
 
             return "{}[^{}] ".format(text, footnote_number)
 
@@ -172,3 +265,73 @@ class MARKDOWN:
         if self.footnotes:
             footnotes = "\n\n".join(self.footnotes)
             return "----\n{}".format(footnotes)
+
+
+class EntryFootnotes(MARKDOWN):
+    """
+    base class for Markdown backends where words share a footnote when they
+    have the same headword, parse and gloss (rather than the same surface
+    text).
+    """
+
+    def footnote_key(self, text, headword, parse, gloss):
+        # a gloss may be a list (e.g. for homonyms) so use it as output
+        return headword, parse, str(gloss)
+
+
+class MARKDOWN_CHAPTER(EntryFootnotes):
+    """
+    Markdown with the footnotes for each chapter output at the end of it
+    rather than all at the end, so they don't build up over a long passage.
+
+    words share a footnote when they have the same entry within a chapter.
+    """
+
+    def comment(self, text):
+        # reader.py passes each event it has no other method for, including
+        # the end of each chapter
+        if text[0] in ["CHAPTER_END", "CHAPTER_END_PARTIAL"] and self.footnotes:
+            footnotes = "\n\n".join(self.footnotes)
+            self.footnotes = []
+            self.footnote_to_counter_map = {}
+            return "\n\n{}\n".format(footnotes)
+        return ""
+
+    def postamble(self):
+        return ""
+
+
+class MARKDOWN_STREAM(EntryFootnotes):
+    """
+    Markdown with all the footnotes at the end, as MARKDOWN, but written to a
+    temporary file as they are generated and streamed back from it in the
+    postamble rather than being kept in memory.
+
+    words share a footnote when they have the same entry but, to keep memory
+    use flat, only the STREAM_FOOTNOTE_KEYS most recently used footnotes are
+    remembered, so an entry not seen for a long while gets a new one.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.footnote_file = None
+        self.footnote_to_counter_map = BoundedMap(STREAM_FOOTNOTE_KEYS)
+
+    def add_footnote(self, footnote):
+        if self.footnote_file is None:
+            self.footnote_file = tempfile.TemporaryFile("w+", encoding="utf-8")
+            self.footnote_file.write("----\n")
+        else:
+            self.footnote_file.write("\n\n")
+        self.footnote_file.write(footnote)
+
+    def postamble(self):
+        # an iterator of parts rather than one string, which reader.py writes
+        # out as it goes
+        if self.footnote_file is None:
+            return
+        with self.footnote_file as f:
+            f.seek(0)
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), ""):
+                yield chunk
+        self.footnote_file = None
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks for the hot paths: reading the text with get_morphgnt (and the
+compact iter_morphgnt and iter_morphgnt_verses), loading YAML,
+sorting the lexicon and generating readers end-to-end with each backend.
+
+Each benchmark is run --repeat times and the fastest time kept. It is then
+run once more under tracemalloc to measure its peak memory. Results can be
+saved as a JSON baseline and later runs compared against it, failing if any
+benchmark is slower by more than --threshold percent.
+
+Everything runs offline against the installed MorphGNT data and the files in
+this directory.
+"""
+
+import argparse
+import functools
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from corpus import load_corpus
+from reader import Resources, output_reader
+from utils import (LEXEMES, WORD, WORDS, get_morphgnt, iter_morphgnt,
+                   iter_morphgnt_verses, load_lexicon, load_path_attr,
+                   load_wordset, load_yaml, max_rss, parse_verse_ranges,
+                   print_status, sort_key, sorted_items)
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example")
+
+PASSAGES = [
+    ("verses", "John 18:1-11"),
+    ("chapter", "John 18:1-40"),
+    ("late", "Acts 28:1-31"),
+    ("book", "John 1:1-21:25"),
+    ("nt", "Matthew 1:1-Revelation 22:21"),
+]
+
+BACKENDS = ["backends.LaTeX", "backends.SILE", "backends.MARKDOWN"]
+
+
+class NullOutput:
+    """
+    file-like object that discards everything written to it.
+    """
+
+    def write(self, s):
+        pass
+
+
+def count_words(verses):
+    return sum(
+        1 for entry in get_morphgnt(verses, load_corpus()) if entry[0] == "WORD")
+
+
+def bench_morphgnt(verses, corpus):
+    def run():
+        count = 0
+        for entry in get_morphgnt(verses, corpus and load_corpus()):
+            if entry[0] == "WORD":
+                count += 1
+        return count
+    return run
+
+
+def bench_iter_morphgnt(verses, corpus):
+    def run():
+        count = 0
+        for code, value in iter_morphgnt(verses, corpus and load_corpus()):
+            if code == WORD:
+                count += 1
+        return count
+    return run
+
+
+def bench_iter_morphgnt_verses(verses, corpus):
+    def run():
+        count = 0
+        for code, value in iter_morphgnt_verses(
+                verses, corpus and load_corpus()):
+            if code == WORDS:
+                count += len(value)
+        return count
+    return run
+
+
+def bench_load_yaml(filename):
+    def run():
+        return len(load_yaml(filename))
+    return run
+
+
+def bench_sorted_items():
+    lexemes = load_yaml(LEXEMES)
+
+    def run():
+        sort_key.cache_clear()
+        return len(sorted_items(lexemes))
+    return run
+
+
+@functools.lru_cache(maxsize=None)
+def example_resources():
+    return Resources(
+        load_yaml(os.path.join(EXAMPLE_DIR, "glosses.yaml")),
+        load_yaml(os.path.join(EXAMPLE_DIR, "headwords.yaml")),
+        load_wordset(os.path.join(EXAMPLE_DIR, "exclude.txt")),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def lexicon_resources():
+    """
+    returns Resources glossing every lemma with its lexicon gloss (as
+    make_glosses.py would) and giving every lemma its lexicon headword, so
+    readers of any passage can be generated.
+    """
+    lexemes = load_lexicon(LEXEMES)
+    return Resources(
+        {lemma: {"default": lexemes[lemma].get("gloss", "@@@")} for lemma in lexemes},
+        {lemma: lexemes[lemma]["headword"] for lemma in lexemes
+         if "headword" in lexemes[lemma]},
+        example_resources().exclusions,
+    )
+
+
+def bench_reader(passage, backend, example):
+    verses = parse_verse_ranges(passage)
+    backend = load_path_attr(backend)
+    resources = example_resources() if example else lexicon_resources()
+    words = count_words(verses)
+
+    def run():
+        output_reader(
+            verses, backend(), "eng", "Times New Roman", resources, NullOutput())
+        return words
+    return run
+
+
+def benchmarks():
+    """
+    yield (name, setup, args) for each benchmark where setup(*args) returns
+    a function that runs it and returns the number of words (or entries) it
+    processed.
+    """
+    for name, passage in PASSAGES:
+        verses = parse_verse_ranges(passage)
+        yield "morphgnt-text-{}".format(name), bench_morphgnt, (verses, False)
+        yield "morphgnt-corpus-{}".format(name), bench_morphgnt, (verses, True)
+        yield "records-text-{}".format(name), bench_iter_morphgnt, (
+            verses, False)
+        yield "records-corpus-{}".format(name), bench_iter_morphgnt, (
+            verses, True)
+        yield "verseblocks-corpus-{}".format(name), bench_iter_morphgnt_verses, (
+            verses, True)
+
+    yield "load_yaml-lexemes", bench_load_yaml, (LEXEMES,)
+    for name in ["glosses", "headwords"]:
+        yield "load_yaml-example-{}".format(name), bench_load_yaml, (
+            os.path.join(EXAMPLE_DIR, name + ".yaml"),)
+
+    yield "sorted_items-lexemes", bench_sorted_items, ()
+
+    for backend in BACKENDS:
+        name = backend.rsplit(".", 1)[-1]
+        yield "reader-{}-verses".format(name), bench_reader, (
+            "John 18:1-11", backend, True)
+        yield "reader-{}-book".format(name), bench_reader, (
+            "John 1:1-21:25", backend, False)
+
+
+def selected(name, patterns):
+    """
+    returns whether the benchmark with the given name should be run given the
+    patterns asked for (all of them if there are none): those whose
+    dash-separated components include all the components of a pattern, in
+    order and consecutively (so "verses" or "LaTeX-verses" match
+    "reader-LaTeX-verses" but "verse" or "LaTeX-book" don't).
+    """
+    if not patterns:
+        return True
+    components = name.split("-")
+    for pattern in patterns:
+        wanted = pattern.split("-")
+        if any(
+                components[i:i + len(wanted)] == wanted
+                for i in range(len(components) - len(wanted) + 1)):
+            return True
+    return False
+
+
+def measure(func, repeat):
+    """
+    returns a dict of the fastest of repeat runs of func, its throughput and
+    its peak traced memory.
+    """
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        count = func()
+        times.append(time.perf_counter() - start)
+    seconds = min(times)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "count": count,
+        "per_second": count / seconds if seconds else None,
+        "peak_bytes": peak,
+    }
+
+
+def compare(results, baseline):
+    """
+    returns a list of (name, change) for each benchmark in both results and
+    baseline where change is the fractional change in time.
+    """
+    return [
+        (name, result["seconds"] / baseline[name]["seconds"] - 1)
+        for name, result in results.items() if name in baseline
+    ]
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "benchmarks", nargs="*",
+        help="only run benchmarks with one of these as whole dash-separated "
+             "parts of their names (e.g. reader, verses or LaTeX-book)")
+    argparser.add_argument(
+        "--repeat", type=int, default=3,
+        help="number of timed runs of each benchmark (defaults to 3)")
+    argparser.add_argument(
+        "--save", help="file to save the results to as JSON")
+    argparser.add_argument(
+        "--compare", help="JSON results file to compare against")
+    argparser.add_argument(
+        "--threshold", type=float, default=10,
+        help="percentage slowdown compared to --compare counted as a "
+             "regression (defaults to 10)")
+
+    args = argparser.parse_args()
+
+    if args.repeat < 1:
+        argparser.error("--repeat must be at least 1")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["benchmarks"]
+    else:
+        baseline = {}
+
+    load_corpus()
+
+    results = {}
+    for name, setup, setup_args in benchmarks():
+        if not selected(name, args.benchmarks):
+            continue
+        result = measure(setup(*setup_args), args.repeat)
+        results[name] = result
+        print("{:32} {:9.4f}s {:12.0f}/s {:9.1f} MB".format(
+            name, result["seconds"], result["per_second"] or 0,
+            result["peak_bytes"] / 1024 / 1024))
+
+    rss = max_rss()
+    if rss is not None:
+        print_status("peak RSS {:.1f} MB".format(rss / 1024 / 1024))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "max_rss": rss,
+                "benchmarks": results,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print_status("saved results to {}".format(args.save))
+
+    if baseline:
+        regressions = 0
+        for name, change in compare(results, baseline):
+            regression = change > args.threshold / 100
+            regressions += regression
+            print("{:32} {:+7.1f}%{}".format(
+                name, change * 100, "  REGRESSION" if regression else ""))
+        if regressions:
+            print_status("{} of {} benchmarks slower by more than {}%".format(
+                regressions, len(results), args.threshold))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+An inverted index from lemma (or inflected form or parse code) to the verses
+it occurs in.
+
+Each index maps a key to a sorted list of packed BBCCVV ints, stored as the
+bytes of an array so only the lists actually looked up are unpacked. The
+indexes are built from the corpus store and cached on disk.
+"""
+
+import argparse
+from array import array
+
+from corpus import corpus_sources, load_corpus
+from utils import BOOK_NAMES, cached, print_status
+
+FIELDS = {
+    "lemma": "lemma",
+    "form": "norm",
+    "parse": "ccat-parse",
+}
+
+
+def build_index(field):
+    """
+    returns a dict mapping each value of the given corpus field to the bytes
+    of an array of the (packed int) verses it occurs in.
+    """
+    corpus = load_corpus()
+    postings = {}
+    for bcv, string_id in zip(corpus.bcv, corpus.columns[field]):
+        verses = postings.get(string_id)
+        if verses is None:
+            postings[string_id] = array("I", [bcv])
+        elif verses[-1] != bcv:
+            verses.append(bcv)
+    return {
+        corpus.string(string_id): verses.tobytes()
+        for string_id, verses in postings.items()
+    }
+
+
+class Concordance:
+    """
+    the lemma, form and parse indexes, each loaded on first use.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+
+    def index(self, kind):
+        if kind not in self.indexes:
+            self.indexes[kind] = cached(
+                "concordance-{}".format(kind), corpus_sources(),
+                lambda: build_index(FIELDS[kind]))
+        return self.indexes[kind]
+
+    def postings(self, kind, key):
+        verses = array("I")
+        verses.frombytes(self.index(kind).get(key, b""))
+        return verses
+
+    def verses(self, lemma=None, form=None, parse=None):
+        """
+        returns a sorted list of the (packed int) verses containing the given
+        lemma, form and/or parse code (all of them if more than one is given,
+        although not necessarily on the same word).
+        """
+        result = None
+        for kind, key in [("lemma", lemma), ("form", form), ("parse", parse)]:
+            if key is None:
+                continue
+            verses = self.postings(kind, key)
+            if result is None:
+                result = verses.tolist()
+            else:
+                result = sorted(set(result).intersection(verses))
+        if result is None:
+            raise ValueError("no lemma, form or parse given")
+        return result
+
+
+def verse_reference(bcv):
+    """
+    returns a human-readable reference (e.g. "John 18:1") for a packed BBCCVV
+    int.
+    """
+    book, chapter, verse = bcv // 10000, bcv // 100 % 100, bcv % 100
+    return "{} {}:{}".format(max(BOOK_NAMES[book - 1], key=len), chapter, verse)
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("lemma", nargs="?", help="lemma to look up")
+    argparser.add_argument("--form", help="normalized inflected form to look up")
+    argparser.add_argument("--parse", help="CCAT parse code to look up")
+    argparser.add_argument(
+        "--bcv", action="store_true",
+        help="output BBCCVV verse ids rather than references")
+
+    args = argparser.parse_args()
+
+    try:
+        verses = Concordance().verses(args.lemma, args.form, args.parse)
+    except ValueError as e:
+        argparser.error(str(e))
+
+    for bcv in verses:
+        if args.bcv:
+            print("{:06d}".format(bcv))
+        else:
+            print(verse_reference(bcv))
+
+    print_status("{} verses".format(len(verses)))
+
+
+if __name__ == "__main__":
+    main()
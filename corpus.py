@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+"""
+A columnar, memory-mapped copy of MorphGNT.
+
+Each of the MorphGNT columns is stored as a fixed-width array of unsigned ints:
+the BBCCVV as a packed int and every other column as the id of a string in a
+table of interned strings (offsets into a single UTF-8 blob). The file is
+built once from the pysblgnt data and then opened with mmap so concurrent
+processes share the same pages.
+
+Running this module directly builds the store if it isn't already up-to-date.
+"""
+
+import bisect
+import mmap
+import sys
+from array import array
+
+from utils import (MORPHGNT_FIELDS, WordRecord, cache_filename, morphgnt_path,
+                   morphgnt_rows, print_status, write_cache_file)
+
+MAGIC = b"GRCORPUS"
+VERSION = 1
+BYTE_ORDER_MARK = 0x01020304
+HEADER_SIZE = 32
+
+STRING_FIELDS = MORPHGNT_FIELDS[1:]
+
+
+class Word:
+    """
+    a lightweight view of one row of the corpus.
+
+    supports the same item access as the dicts yielded by morphgnt_rows.
+    """
+
+    __slots__ = ("corpus", "index")
+
+    def __init__(self, corpus, index):
+        self.corpus = corpus
+        self.index = index
+
+    def __getitem__(self, field):
+        if field == "bcv":
+            return "{:06d}".format(self.corpus.bcv[self.index])
+        return self.corpus.string(self.corpus.columns[field][self.index])
+
+    @property
+    def lemma_id(self):
+        """
+        the id of the lemma in the corpus' table of interned strings.
+        """
+        return self.corpus.columns["lemma"][self.index]
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return "Word({})".format(", ".join(
+            "{}={}".format(field, self[field]) for field in MORPHGNT_FIELDS))
+
+
+class Corpus:
+    """
+    the columnar MorphGNT store over the given buffer (normally an mmap).
+
+    raises ValueError if the buffer isn't a complete corpus file of this
+    version.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        if len(view) < HEADER_SIZE or bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError("not a corpus file")
+        version, byte_order, num_rows, num_strings = \
+            view[len(MAGIC):len(MAGIC) + 16].cast("I")
+        if (version, byte_order) != (VERSION, BYTE_ORDER_MARK):
+            raise ValueError("incompatible corpus file")
+        columns_size = 4 * (
+            num_rows * (1 + len(STRING_FIELDS)) + num_strings + 1)
+        if len(view) < HEADER_SIZE + columns_size:
+            raise ValueError("truncated corpus file")
+
+        def column(start, length):
+            return view[start:start + 4 * length].cast("I"), start + 4 * length
+
+        self.bcv, pos = column(HEADER_SIZE, num_rows)
+        self.columns = {}
+        for field in STRING_FIELDS:
+            self.columns[field], pos = column(pos, num_rows)
+        self.offsets, pos = column(pos, num_strings + 1)
+        self.blob = view[pos:]
+        if len(self.blob) != self.offsets[-1]:
+            raise ValueError("truncated corpus file")
+        self.strings = [None] * num_strings
+
+    def __len__(self):
+        return len(self.bcv)
+
+    def __iter__(self):
+        return (Word(self, i) for i in range(len(self)))
+
+    def string(self, string_id):
+        """
+        returns the interned string with the given id.
+        """
+        s = self.strings[string_id]
+        if s is None:
+            s = self.strings[string_id] = str(
+                self.blob[self.offsets[string_id]:self.offsets[string_id + 1]],
+                "utf-8")
+        return s
+
+    def span(self, start_bcv, end_bcv):
+        """
+        returns the (start, end) row indices covering the given inclusive
+        range of packed BBCCVV ints.
+        """
+        return (
+            bisect.bisect_left(self.bcv, start_bcv),
+            bisect.bisect_right(self.bcv, end_bcv),
+        )
+
+    def book_span(self, book_num, start=None):
+        """
+        returns the (start, end) row indices of the given book number, starting
+        at the given BBCCVV if it is in the book (and otherwise at the start of
+        the book, as morphgnt_rows does with an unknown offset).
+        """
+        book_start, book_end = self.span(book_num * 10000, book_num * 10000 + 9999)
+        if start is not None:
+            i = bisect.bisect_left(self.bcv, int(start), book_start, book_end)
+            if i < book_end and self.bcv[i] == int(start):
+                book_start = i
+        return book_start, book_end
+
+    def rows(self, book_num, start=None):
+        """
+        yield a Word for each row in the given book number, from the given
+        BBCCVV as for book_span.
+        """
+        for i in range(*self.book_span(book_num, start)):
+            yield Word(self, i)
+
+    def records(self, book_num, start=None):
+        """
+        returns an iterator of WordRecords for the rows in the given book
+        number, from the given BBCCVV as for book_span.
+        """
+        book_start, book_end = self.book_span(book_num, start)
+        return map(WordRecord._make, zip(self.bcv[book_start:book_end], *[
+            map(self.string, self.columns[field][book_start:book_end])
+            for field in STRING_FIELDS
+        ]))
+
+
+def corpus_sources():
+    return [morphgnt_path(book_num) for book_num in range(1, 28)]
+
+
+def build_corpus():
+    """
+    returns the bytes of a corpus file built from the MorphGNT data.
+    """
+    bcv = array("I")
+    columns = {field: array("I") for field in STRING_FIELDS}
+    string_ids = {}
+    for book_num in range(1, 28):
+        for row in morphgnt_rows(book_num):
+            bcv.append(int(row["bcv"]))
+            for field in STRING_FIELDS:
+                s = row[field]
+                string_id = string_ids.get(s)
+                if string_id is None:
+                    string_id = string_ids[s] = len(string_ids)
+                columns[field].append(string_id)
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for s in string_ids:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+
+    header = MAGIC + array(
+        "I", [VERSION, BYTE_ORDER_MARK, len(bcv), len(string_ids)]).tobytes()
+    parts = [header.ljust(HEADER_SIZE, b"\0"), bcv.tobytes()]
+    parts.extend(columns[field].tobytes() for field in STRING_FIELDS)
+    parts.extend([offsets.tobytes(), bytes(blob)])
+    return b"".join(parts)
+
+
+def open_corpus(filename):
+    """
+    returns the Corpus in the given store file, mapped into memory.
+    """
+    with open(filename, "rb") as f:
+        return Corpus(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+_corpus = None
+
+
+def load_corpus():
+    """
+    returns the Corpus, building (and caching) the store first if it doesn't
+    exist, can't be read (e.g. it was truncated) or the MorphGNT data has
+    changed since it was built.
+
+    the store is only opened once per process.
+    """
+    global _corpus
+    if _corpus is None:
+        filename = cache_filename(
+            "corpus-{}".format(sys.byteorder), corpus_sources())
+        try:
+            _corpus = open_corpus(filename)
+        except (OSError, ValueError):
+            data = build_corpus()
+            write_cache_file(filename, data)
+            try:
+                _corpus = open_corpus(filename)
+            except (OSError, ValueError):
+                # the cache isn't writable so just use the data in memory
+                _corpus = Corpus(data)
+    return _corpus
+
+
+if __name__ == "__main__":
+    corpus = load_corpus()
+    print_status("corpus has {} words and {} distinct strings".format(
+        len(corpus), len(corpus.strings)))
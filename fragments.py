@@ -0,0 +1,133 @@
+"""
+An on-disk cache of rendered verse fragments.
+
+Fragments are content-addressed: the key is a digest of everything that went
+into rendering a verse's words (the backend, the language and, for each word,
+its text and resolved headword, parse and gloss) so editing one gloss only
+changes the keys of the verses that use it. The cache is bounded in size,
+evicting the least recently used fragments first.
+"""
+
+import hashlib
+import os
+import re
+import sys
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# the names of fragment files (fragment_key's hex SHA-1 digests)
+FRAGMENT_NAME = re.compile("[0-9a-f]{40}")
+
+
+def backend_key(backend, language):
+    """
+    returns a string identifying the given backend and language for use in
+    fragment keys, including the backend module's size and modification time
+    (and the backend's cache_key, if it has one, for anything else its output
+    depends on, such as its settings) so fragments aren't reused across
+    changes to the backend.
+    """
+    cls = type(backend)
+    st = os.stat(sys.modules[cls.__module__].__file__)
+    key = "{}.{}:{}:{}".format(
+        cls.__module__, cls.__qualname__, st.st_size, st.st_mtime_ns)
+    if hasattr(backend, "cache_key"):
+        key += ":" + backend.cache_key()
+    return "{}:{}".format(key, language)
+
+
+def fragment_key(prefix, words):
+    """
+    returns the key for a verse fragment given the backend_key prefix and the
+    list of argument tuples that will be passed to the backend's word method.
+    """
+    return hashlib.sha1(
+        "{}\n{!r}".format(prefix, words).encode("utf-8")).hexdigest()
+
+
+class FragmentCache:
+    """
+    size-bounded cache of rendered fragments stored one per file in the given
+    directory.
+
+    each file's modification time records when it was last used and, once the
+    total size exceeds max_bytes, the least recently used are removed. only
+    files named like fragments are counted or removed, so anything else in
+    the directory is left alone.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in self.fragments())
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def fragments(self):
+        """
+        yield a DirEntry for each fragment file in the directory.
+        """
+        for entry in os.scandir(self.directory):
+            if FRAGMENT_NAME.fullmatch(entry.name) and entry.is_file():
+                yield entry
+
+    def get(self, key):
+        """
+        returns the fragment with the given key or None if it isn't cached.
+        """
+        try:
+            with open(self.path(key), "rb") as f:
+                fragment = f.read().decode("utf-8")
+            os.utime(self.path(key))
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return fragment
+
+    def put(self, key, fragment):
+        data = fragment.encode("utf-8")
+        tmp = "{}.{}.tmp".format(self.path(key), os.getpid())
+        try:
+            replaced = os.stat(self.path(key)).st_size
+        except OSError:
+            replaced = 0
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            return
+        self.size += len(data) - replaced
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        removes the least recently used fragments until the cache is no more
+        than three quarters of max_bytes (so eviction isn't needed again with
+        the very next fragment).
+        """
+        entries = []
+        for entry in self.fragments():
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        entries.sort()
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
@@ -0,0 +1,113 @@
+"""
+A lemma frequency index over the whole of MorphGNT.
+
+For the whole corpus and for each book and chapter, the index holds the lemmas
+in descending order of frequency (ties in corpus order) along with their
+counts, so threshold and top-N queries are a bisect and a slice rather than a
+pass over the corpus. It is built from the corpus store and cached on disk.
+"""
+
+import bisect
+from collections import Counter, defaultdict
+
+from corpus import corpus_sources, load_corpus
+from utils import cached
+
+
+def scope_key(book=None, chapter=None):
+    """
+    returns the index key for the whole corpus, a book or a chapter of a book.
+    """
+    if book is None:
+        return ""
+    elif chapter is None:
+        return "{:02d}".format(book)
+    else:
+        return "{:02d}{:02d}".format(book, chapter)
+
+
+def build_frequencies():
+    """
+    returns a dict mapping each scope key to a pair of lists: the lemmas in
+    descending order of frequency and their negated counts (i.e. ascending,
+    for bisecting).
+    """
+    corpus = load_corpus()
+    counters = defaultdict(Counter)
+    for bcv, lemma_id in zip(corpus.bcv, corpus.columns["lemma"]):
+        counters[""][lemma_id] += 1
+        counters[scope_key(bcv // 10000)][lemma_id] += 1
+        counters[scope_key(bcv // 10000, bcv // 100 % 100)][lemma_id] += 1
+
+    frequencies = {}
+    for key, counter in counters.items():
+        # most_common is stable so ties stay in order of first occurrence
+        ranked = counter.most_common()
+        frequencies[key] = (
+            [corpus.string(lemma_id) for lemma_id, count in ranked],
+            [-count for lemma_id, count in ranked],
+        )
+    return frequencies
+
+
+class FrequencyIndex:
+
+    def __init__(self, frequencies):
+        self.frequencies = frequencies
+        self.ranks = {}
+
+    def scope(self, book=None, chapter=None):
+        try:
+            return self.frequencies[scope_key(book, chapter)]
+        except KeyError:
+            raise ValueError("no such book or chapter")
+
+    def num_lemmas(self, book=None, chapter=None):
+        """
+        returns the number of distinct lemmas in the given scope.
+        """
+        return len(self.scope(book, chapter)[0])
+
+    def at_least(self, occurrences, book=None, chapter=None):
+        """
+        returns the lemmas occurring the given number of times or more in the
+        given scope, most frequent first.
+        """
+        lemmas, negated_counts = self.scope(book, chapter)
+        return lemmas[:bisect.bisect_right(negated_counts, -occurrences)]
+
+    def top(self, n, book=None, chapter=None):
+        """
+        returns the n most frequent lemmas in the given scope.
+        """
+        return self.scope(book, chapter)[0][:n]
+
+    def count(self, lemma, book=None, chapter=None):
+        """
+        returns the number of occurrences of the lemma in the given scope.
+        """
+        rank = self.rank(lemma, book, chapter)
+        if rank is None:
+            return 0
+        return -self.scope(book, chapter)[1][rank - 1]
+
+    def rank(self, lemma, book=None, chapter=None):
+        """
+        returns the 1-based frequency rank of the lemma in the given scope or
+        None if it doesn't occur there.
+        """
+        key = scope_key(book, chapter)
+        if key not in self.ranks:
+            self.ranks[key] = {
+                lemma: rank
+                for rank, lemma in enumerate(self.scope(book, chapter)[0], 1)
+            }
+        return self.ranks[key].get(lemma)
+
+
+def load_frequencies():
+    """
+    returns the FrequencyIndex, building (and caching) it first if needed.
+    """
+    return FrequencyIndex(
+        cached("frequencies", corpus_sources(), build_frequencies))
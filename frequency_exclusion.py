@@ -1,29 +1,47 @@
 #!/usr/bin/env python3
 
 import argparse
-from collections import defaultdict
 
-from pysblgnt import morphgnt_rows
-from utils import print_status
+from frequencies import load_frequencies
+from utils import BOOK_NAME_MAPPINGS, print_status
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument(
-    "occurrences", type=int,
-    help="lower occurrence limit to exclude")
+    "occurrences", type=int, nargs="?", default=1,
+    help="lower occurrence limit to exclude (defaults to 1)")
+argparser.add_argument(
+    "--top", type=int,
+    help="only exclude (at most) this many of the most frequent lexemes")
+argparser.add_argument(
+    "--book",
+    help="count occurrences within this book only (e.g. 'John')")
+argparser.add_argument(
+    "--chapter", type=int,
+    help="count occurrences within this chapter of --book only")
 args = argparser.parse_args()
 
-lexeme_counts = defaultdict(int)
+if args.book:
+    if args.book not in BOOK_NAME_MAPPINGS:
+        argparser.error("unknown book {}".format(args.book))
+    book = BOOK_NAME_MAPPINGS[args.book]
+elif args.chapter:
+    argparser.error("--chapter requires --book")
+else:
+    book = None
+
+frequencies = load_frequencies()
+
+try:
+    lexemes = frequencies.at_least(args.occurrences, book, args.chapter)
+except ValueError as e:
+    argparser.error(str(e))
 
-for book_num in range(1, 28):
-    for row in morphgnt_rows(book_num):
-        lexeme_counts[row["lemma"]] += 1
+if args.top is not None:
+    lexemes = lexemes[:args.top]
 
-num_lexemes = 0
-for lexeme, count in lexeme_counts.items():
-    if count >= args.occurrences:
-        print(lexeme)
-        num_lexemes += 1
+for lexeme in lexemes:
+    print(lexeme)
 
 print_status("output {}/{} lexemes appearing {} times or more".format(
-    num_lexemes, len(lexeme_counts), args.occurrences)
+    len(lexemes), frequencies.num_lemmas(book, args.chapter), args.occurrences)
 )
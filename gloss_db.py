@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+"""
+An SQLite store of glosses (in any number of languages) and headwords.
+
+Glosses are keyed by lemma, language and either "default" or, for an override,
+the BBCCVV or passage (e.g. "John 18:1-11") it applies to, just as in a
+glosses YAML file. Readers look up only the lemmas in their passage, a batch
+at a time, so a large multilingual store doesn't have to be loaded (or
+parsed) in full for every reader, and concurrent readers share the database
+file's pages.
+
+Running this module directly imports glosses and headwords from YAML files
+into a database or exports them back out in the same format, e.g.
+
+    ./gloss_db.py glosses.db import --glosses glosses.yaml --language eng
+    ./gloss_db.py glosses.db export --glosses glosses-eng.yaml --language eng
+"""
+
+import argparse
+import collections.abc
+import functools
+import json
+import os
+import sqlite3
+import threading
+import urllib.request
+
+import yaml
+
+from corpus import load_corpus
+from utils import load_yaml, print_status, sorted_items
+
+SQLITE_MAGIC = b"SQLite format 3\0"
+
+# the most lemmas looked up in one query (SQLite has a limit on the number of
+# parameters, as low as 999 in older versions)
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS glosses (
+    lemma TEXT NOT NULL,
+    language TEXT NOT NULL,
+    key TEXT NOT NULL,
+    gloss TEXT NOT NULL,
+    PRIMARY KEY (language, lemma, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS headwords (
+    lemma TEXT NOT NULL PRIMARY KEY,
+    headword TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def is_database(filename):
+    """
+    returns whether the given file is an SQLite database (rather than YAML).
+    """
+    try:
+        with open(filename, "rb") as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def passage_lemmas(verses):
+    """
+    returns a list of the lemmas in the given verses (as taken by
+    get_morphgnt).
+    """
+    corpus = load_corpus()
+    lemma_ids = set()
+    for verse_range in verses:
+        if isinstance(verse_range, (list, tuple)):
+            start, end = verse_range
+        else:
+            start = end = verse_range
+        lemma_ids.update(corpus.columns["lemma"][
+            slice(*corpus.span(int(start), int(end)))])
+    return [corpus.string(lemma_id) for lemma_id in lemma_ids]
+
+
+class DatabaseMapping(collections.abc.Mapping):
+    """
+    read-only mapping of lemma to its entry in a GlossDatabase, keeping each
+    entry once it has been looked up.
+
+    fetch(lemmas) returns a dict of the entries for the given list of lemmas
+    (or for every lemma if None) and exists() whether there are any entries.
+    lookups are made under a lock so the mapping can be shared between
+    threads.
+    """
+
+    def __init__(self, fetch, exists):
+        self.fetch = fetch
+        self.exists = exists
+        self.entries = {}
+        self.missing = set()
+        self.complete = False
+        self.lock = threading.Lock()
+
+    def prefetch(self, lemmas):
+        """
+        looks up the entries for the given lemmas, a batch at a time.
+        """
+        with self.lock:
+            if self.complete:
+                return
+            lemmas = [
+                lemma for lemma in set(lemmas)
+                if lemma not in self.entries and lemma not in self.missing
+            ]
+            for i in range(0, len(lemmas), BATCH_SIZE):
+                batch = lemmas[i:i + BATCH_SIZE]
+                self.entries.update(self.fetch(batch))
+                self.missing.update(
+                    lemma for lemma in batch if lemma not in self.entries)
+
+    def load_all(self):
+        with self.lock:
+            if not self.complete:
+                self.entries = self.fetch(None)
+                self.missing = set()
+                self.complete = True
+
+    def __getitem__(self, lemma):
+        if lemma not in self.entries:
+            self.prefetch([lemma])
+        return self.entries[lemma]
+
+    def __iter__(self):
+        self.load_all()
+        return iter(self.entries)
+
+    def __len__(self):
+        self.load_all()
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries) or self.exists()
+
+
+class GlossDatabase:
+    """
+    the glosses and headwords in an SQLite database.
+
+    the database is opened read-only unless create is true, in which case it
+    is created if it doesn't exist. the connection is made on first use (and
+    again in any forked process or unpickled copy) and may be shared between
+    threads.
+    """
+
+    def __init__(self, filename, create=False):
+        self.filename = filename
+        self.create = create
+        self.pid = None
+        self.views = {}
+
+    def __getstate__(self):
+        # connections can't be pickled so a copy makes its own
+        state = dict(self.__dict__)
+        state.pop("_connection", None)
+        state["pid"] = None
+        state["views"] = {}
+        return state
+
+    @property
+    def connection(self):
+        if self.pid != os.getpid():
+            if self.create:
+                self._connection = sqlite3.connect(
+                    self.filename, check_same_thread=False)
+                self._connection.executescript(SCHEMA)
+            else:
+                self._connection = sqlite3.connect(
+                    "file:{}?mode=ro".format(urllib.request.pathname2url(
+                        os.path.abspath(self.filename))),
+                    uri=True, check_same_thread=False)
+            self.pid = os.getpid()
+        return self._connection
+
+    def query(self, sql, lemmas, params=()):
+        """
+        runs the given SQL with "{}" replaced by "lemma IN (...)" for the
+        given list of lemmas (or by true for all lemmas if None), returning a
+        list of the rows.
+        """
+        if lemmas is None:
+            return self.connection.execute(sql.format("1"), params).fetchall()
+        return self.connection.execute(
+            sql.format("lemma IN ({})".format(", ".join("?" * len(lemmas)))),
+            tuple(params) + tuple(lemmas)).fetchall()
+
+    def fetch_glosses(self, language, lemmas):
+        entries = {}
+        for lemma, key, gloss in self.query(
+                "SELECT lemma, key, gloss FROM glosses "
+                "WHERE language = ? AND {} ORDER BY lemma, key",
+                lemmas, [language]):
+            entries.setdefault(lemma, {})[key] = json.loads(gloss)
+        return entries
+
+    def fetch_headwords(self, lemmas):
+        return dict(self.query(
+            "SELECT lemma, headword FROM headwords WHERE {}", lemmas))
+
+    def has_glosses(self, language):
+        return bool(self.connection.execute(
+            "SELECT 1 FROM glosses WHERE language = ? LIMIT 1",
+            [language]).fetchall())
+
+    def has_headwords(self):
+        return bool(self.connection.execute(
+            "SELECT 1 FROM headwords LIMIT 1").fetchall())
+
+    def glosses(self, language):
+        """
+        returns a mapping, like a loaded glosses YAML file, of the glosses
+        for the given language.
+        """
+        key = ("glosses", language)
+        if key not in self.views:
+            self.views[key] = DatabaseMapping(
+                functools.partial(self.fetch_glosses, language),
+                functools.partial(self.has_glosses, language))
+        return self.views[key]
+
+    def headwords(self):
+        """
+        returns a mapping, like a loaded headwords YAML file, of the
+        headwords.
+        """
+        key = ("headwords",)
+        if key not in self.views:
+            self.views[key] = DatabaseMapping(
+                self.fetch_headwords, self.has_headwords)
+        return self.views[key]
+
+    def languages(self):
+        return [language for language, in self.connection.execute(
+            "SELECT DISTINCT language FROM glosses ORDER BY language")]
+
+    def import_glosses(self, glosses, language, replace=False):
+        """
+        stores the given glosses (as loaded from a glosses YAML file) for the
+        given language, replacing the entries of any lemmas already stored
+        (or, if replace is true, all the glosses for the language).
+
+        raises ValueError if a key isn't a string (such as a verse id YAML
+        has read as a number) rather than storing it under the wrong id.
+        """
+        for lemma, entry in glosses.items():
+            for key in entry:
+                if not isinstance(key, str):
+                    raise ValueError(
+                        "gloss key {!r} for {} isn't a string (quote verse "
+                        "ids)".format(key, lemma))
+        with self.connection as connection:
+            if replace:
+                connection.execute(
+                    "DELETE FROM glosses WHERE language = ?", [language])
+            else:
+                connection.executemany(
+                    "DELETE FROM glosses WHERE language = ? AND lemma = ?",
+                    ((language, lemma) for lemma in glosses))
+            connection.executemany(
+                "INSERT INTO glosses (lemma, language, key, gloss) "
+                "VALUES (?, ?, ?, ?)", (
+                    (lemma, language, key,
+                     json.dumps(gloss, ensure_ascii=False))
+                    for lemma, entry in glosses.items()
+                    for key, gloss in entry.items()
+                ))
+        self.views.clear()
+
+    def import_headwords(self, headwords, replace=False):
+        """
+        stores the given headwords (as loaded from a headwords YAML file),
+        replacing those of any lemmas already stored (or, if replace is true,
+        all of them).
+        """
+        with self.connection as connection:
+            if replace:
+                connection.execute("DELETE FROM headwords")
+            connection.executemany(
+                "INSERT OR REPLACE INTO headwords (lemma, headword) "
+                "VALUES (?, ?)", headwords.items())
+        self.views.clear()
+
+
+def dump_yaml(data, filename):
+    """
+    writes a mapping to a YAML file in collation order, in the same format as
+    the glosses and headwords files.
+    """
+    data = {
+        key: dict(sorted_items(value)) if isinstance(value, dict) else value
+        for key, value in sorted_items(data)
+    }
+    with open(filename, "w") as f:
+        yaml.dump(
+            data, f, allow_unicode=True, default_flow_style=False,
+            sort_keys=False, indent=4, width=1000)
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("database", help="SQLite database file")
+    argparser.add_argument(
+        "action", choices=["import", "export"],
+        help="import YAML files into the database or export them from it")
+    argparser.add_argument("--glosses", help="glosses YAML file")
+    argparser.add_argument("--headwords", help="headwords YAML file")
+    argparser.add_argument(
+        "--language", default="eng",
+        help="language of the glosses (defaults to eng)")
+    argparser.add_argument(
+        "--replace", action="store_true",
+        help="on import, remove all the existing glosses for the language "
+             "(and headwords) rather than just those of the lemmas imported")
+
+    args = argparser.parse_args()
+
+    if not (args.glosses or args.headwords):
+        argparser.error("at least one of --glosses or --headwords is required")
+
+    if args.action == "import":
+        database = GlossDatabase(args.database, create=True)
+        if args.glosses:
+            glosses = load_yaml(args.glosses)
+            try:
+                database.import_glosses(glosses, args.language, args.replace)
+            except ValueError as e:
+                argparser.error(str(e))
+            print_status("imported {} {} glosses into {}".format(
+                len(glosses), args.language, args.database))
+        if args.headwords:
+            headwords = load_yaml(args.headwords)
+            database.import_headwords(headwords, args.replace)
+            print_status("imported {} headwords into {}".format(
+                len(headwords), args.database))
+    else:
+        if not is_database(args.database):
+            argparser.error("{} isn't a database".format(args.database))
+        database = GlossDatabase(args.database)
+        if args.glosses:
+            glosses = database.glosses(args.language)
+            if not glosses:
+                argparser.error("no {} glosses in {} (it has {})".format(
+                    args.language, args.database,
+                    ", ".join(database.languages()) or "none"))
+            dump_yaml(glosses, args.glosses)
+            print_status("exported {} {} glosses to {}".format(
+                len(glosses), args.language, args.glosses))
+        if args.headwords:
+            headwords = database.headwords()
+            dump_yaml(headwords, args.headwords)
+            print_status("exported {} headwords to {}".format(
+                len(headwords), args.headwords))
+
+
+if __name__ == "__main__":
+    main()
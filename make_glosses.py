@@ -2,8 +2,10 @@
 
 import argparse
 
+from corpus import load_corpus
 from utils import (
-    load_yaml, load_wordset, sorted_items, get_morphgnt, parse_verse_ranges)
+    load_lexicon, load_yaml, load_wordset, sorted_items, get_morphgnt,
+    parse_verse_ranges, Stats, add_stats_arguments)
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument(
@@ -20,31 +22,57 @@ argparser.add_argument(
     default="lexemes.yaml",
     help="path to lexemes file "
          "(defaults to lexemes.yaml)")
+add_stats_arguments(argparser)
 
 args = argparser.parse_args()
 
+stats = Stats(args.stats or bool(args.stats_json), args.profile)
+
 verses = parse_verse_ranges(args.verses)
 
-if args.exclude:
-    exclusions = load_wordset(args.exclude)
-else:
-    exclusions = set()
+with stats.stage("resources"):
+    if args.exclude:
+        exclusions = load_wordset(args.exclude)
+    else:
+        exclusions = set()
+
+    lexemes = load_lexicon(args.lexemes)
 
-lexemes = load_yaml(args.lexemes)
+    if args.glosses:
+        glosses = load_yaml(args.glosses)
+    else:
+        glosses = {}
 
-if args.glosses:
-    glosses = load_yaml(args.glosses)
-else:
-    glosses = {}
+with stats.stage("corpus"):
+    corpus = load_corpus()
 
+events = get_morphgnt(verses, corpus)
+if stats:
+    events = stats.timed("text", events, "events")
+    stats.counts["existing glosses"] = len(glosses)
 
-for entry in get_morphgnt(verses):
+for entry in events:
     if entry[0] == "WORD":
         lemma = entry[1]["lemma"]
         if lemma not in exclusions and lemma not in glosses:
             glosses[lemma] = {"default": lexemes[lemma].get("gloss", "\"@@@\"")}
 
-for lemma, gloss_entries in sorted_items(glosses):
-    print("{}:".format(lemma))
-    for k, v in sorted_items(gloss_entries):
-        print("    {}: {}".format(k, v))
+if stats:
+    stats.counts["glosses added"] = len(glosses) - stats.counts["existing glosses"]
+
+with stats.stage("sort"):
+    items = [
+        (lemma, sorted_items(gloss_entries))
+        for lemma, gloss_entries in sorted_items(glosses)
+    ]
+
+with stats.stage("output"):
+    for lemma, gloss_entries in items:
+        print("{}:".format(lemma))
+        for k, v in gloss_entries:
+            if k.isdigit():
+                # quote BBCCVV keys so YAML doesn't read them back as ints
+                k = "\"{}\"".format(k)
+            print("    {}: {}".format(k, v))
+
+stats.finish(args.stats_json)
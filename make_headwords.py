@@ -2,8 +2,10 @@
 
 import argparse
 
+from corpus import load_corpus
 from utils import (
-    load_yaml, load_wordset, sorted_items, get_morphgnt, parse_verse_ranges)
+    load_lexicon, load_yaml, load_wordset, sorted_items, get_morphgnt,
+    parse_verse_ranges, Stats, add_stats_arguments)
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument("verses", help="verses to cover (e.g. 'John 18:1-11')")
@@ -15,25 +17,36 @@ argparser.add_argument(
     default="lexemes.yaml",
     help="path to lexemes file "
     "(defaults to lexemes.yaml)")
+add_stats_arguments(argparser)
 
 args = argparser.parse_args()
 
+stats = Stats(args.stats or bool(args.stats_json), args.profile)
+
 verses = parse_verse_ranges(args.verses)
 
-if args.exclude:
-    exclusions = load_wordset(args.exclude)
-else:
-    exclusions = set()
+with stats.stage("resources"):
+    if args.exclude:
+        exclusions = load_wordset(args.exclude)
+    else:
+        exclusions = set()
+
+    lexemes = load_lexicon(args.lexemes)
 
-lexemes = load_yaml(args.lexemes)
+    if args.headwords:
+        headwords = load_yaml(args.headwords)
+    else:
+        headwords = {}
 
-if args.headwords:
-    headwords = load_yaml(args.headwords)
-else:
-    headwords = {}
+with stats.stage("corpus"):
+    corpus = load_corpus()
 
+events = get_morphgnt(verses, corpus)
+if stats:
+    events = stats.timed("text", events, "events")
+    stats.counts["existing headwords"] = len(headwords)
 
-for entry in get_morphgnt(verses):
+for entry in events:
     if entry[0] == "WORD":
         lemma = entry[1]["lemma"]
         if lemma not in exclusions and lemma not in headwords:
@@ -41,5 +54,15 @@ for entry in get_morphgnt(verses):
             if pos in ["N-", "A-"]:
                 headwords[lemma] = lexemes[lemma]["headword"]
 
-for lemma, headword in sorted_items(headwords):
-    print("{}: {}".format(lemma, headword))
+if stats:
+    stats.counts["headwords added"] = (
+        len(headwords) - stats.counts["existing headwords"])
+
+with stats.stage("sort"):
+    items = sorted_items(headwords)
+
+with stats.stage("output"):
+    for lemma, headword in items:
+        print("{}: {}".format(lemma, headword))
+
+stats.finish(args.stats_json)
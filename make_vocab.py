@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""
+Builds glosses and headwords files (and optionally per-lemma occurrence counts)
+for one or more passages in a single pass over the text, adding to any
+existing files rather than regenerating them.
+
+Entries already in the files are kept exactly as they are (so any edits are
+preserved) and new entries are merged in, in order, without reparsing or
+re-sorting the existing ones.
+"""
+
+import argparse
+import heapq
+import os
+from collections import Counter
+
+from corpus import load_corpus
+from utils import (WORD, Stats, add_stats_arguments, iter_morphgnt,
+                   load_lexicon, load_wordset, parse_verse_ranges, print_status,
+                   sort_key)
+
+
+def read_entries(filename):
+    """
+    returns (preamble, entries) for the given YAML file where entries is a
+    list of (lemma, text) pairs for its top-level entries, text being the
+    entry's lines exactly as in the file, and preamble is any comments and
+    blank lines before the first entry.
+
+    a missing file has no preamble or entries.
+    """
+    preamble = ""
+    entries = []
+    if not os.path.exists(filename):
+        return preamble, entries
+    with open(filename) as f:
+        for line in f:
+            if line.strip() and not line[0].isspace() and line[0] != "#":
+                entries.append((line.split(":", 1)[0], line))
+            elif entries:
+                lemma, text = entries[-1]
+                entries[-1] = (lemma, text + line)
+            else:
+                preamble += line
+    return preamble, entries
+
+
+def merge_entries(filename, new_entries):
+    """
+    adds the given (lemma, text) pairs to the YAML file, keeping existing
+    entries and putting each new one in collation order.
+
+    returns the number of entries added.
+    """
+    preamble, entries = read_entries(filename)
+    existing = {lemma for lemma, text in entries}
+    new_entries = sorted(
+        ((lemma, text) for lemma, text in new_entries if lemma not in existing),
+        key=lambda entry: sort_key(entry[0]))
+    merged = heapq.merge(
+        entries, new_entries, key=lambda entry: sort_key(entry[0]))
+    tmp = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp, "w") as f:
+        f.write(preamble)
+        f.write("".join(text for lemma, text in merged))
+    os.replace(tmp, filename)
+    return len(new_entries)
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "verses", nargs="+",
+        help="verses to cover (e.g. 'John 18:1-11'), any number of times")
+    argparser.add_argument("--exclude", help="exclusion list file")
+    argparser.add_argument(
+        "--glosses", help="glosses file to create or add to")
+    argparser.add_argument(
+        "--headwords", help="headwords file to create or add to")
+    argparser.add_argument(
+        "--occurrences", help="file to write the occurrences of each lemma to")
+    argparser.add_argument(
+        "--lexicon", dest="lexemes",
+        default="lexemes.yaml",
+        help="path to lexemes file "
+             "(defaults to lexemes.yaml)")
+    add_stats_arguments(argparser)
+
+    args = argparser.parse_args()
+
+    if not (args.glosses or args.headwords or args.occurrences):
+        argparser.error("at least one of --glosses, --headwords or --occurrences is required")
+
+    stats = Stats(args.stats or bool(args.stats_json), args.profile)
+
+    verses = parse_verse_ranges("; ".join(args.verses))
+
+    with stats.stage("resources"):
+        if args.exclude:
+            exclusions = load_wordset(args.exclude)
+        else:
+            exclusions = set()
+        lexemes = load_lexicon(args.lexemes)
+
+    with stats.stage("corpus"):
+        corpus = load_corpus()
+
+    events = iter_morphgnt(verses, corpus)
+    if stats:
+        events = stats.timed("text", events, "events")
+
+    counts = Counter()
+    nominals = set()
+
+    for code, word in events:
+        if code == WORD:
+            counts[word.lemma] += 1
+            if word.ccat_pos in ["N-", "A-"]:
+                nominals.add(word.lemma)
+
+    lemmas = [lemma for lemma in counts if lemma not in exclusions]
+
+    stats.counts["words"] = sum(counts.values())
+    stats.counts["excluded words"] = sum(
+        count for lemma, count in counts.items() if lemma in exclusions)
+
+    if args.glosses:
+        with stats.stage("glosses"):
+            added = merge_entries(args.glosses, (
+                (lemma, "{}:\n    default: {}\n".format(
+                    lemma, lexemes[lemma].get("gloss", "\"@@@\"")))
+                for lemma in lemmas
+            ))
+        stats.counts["glosses added"] = added
+        print_status("added {} glosses to {}".format(added, args.glosses))
+
+    if args.headwords:
+        with stats.stage("headwords"):
+            added = merge_entries(args.headwords, (
+                (lemma, "{}: {}\n".format(lemma, lexemes[lemma]["headword"]))
+                for lemma in lemmas if lemma in nominals
+            ))
+        stats.counts["headwords added"] = added
+        print_status("added {} headwords to {}".format(added, args.headwords))
+
+    if args.occurrences:
+        with open(args.occurrences, "w") as f:
+            f.write("".join(
+                "{}: {}\n".format(lemma, count)
+                for lemma, count in counts.most_common()
+            ))
+        print_status("wrote occurrences of {} lemmas to {}".format(
+            len(counts), args.occurrences))
+
+    stats.finish(args.stats_json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""
+Plans the vocabulary for a graded series of readers.
+
+Given an ordered list of passages (one per lesson) and a target coverage, this
+works out for each lesson the smallest set of new lemmas which, along with
+everything learnt in earlier lessons (and any initial exclusion list), covers
+at least the target percentage of the lesson's words. It then writes, for each
+lesson, the new vocabulary and the cumulative exclusion list to use with
+reader.py (that is, everything known once the new vocabulary has been learnt).
+"""
+
+import argparse
+import math
+import os
+from collections import Counter
+
+from corpus import load_corpus
+from utils import (get_morphgnt, load_wordset, parse_verse_ranges,
+                   print_status, sort_key)
+
+
+def plan_lesson(counts, known, coverage):
+    """
+    returns the smallest list of lemma ids, not in the set known, needed for
+    the known lemmas to cover the given fraction of the tokens counted (a
+    Counter of lemma ids).
+
+    taking the most frequent unknown lemmas first is optimal as each lemma
+    covers exactly as many tokens as it occurs.
+    """
+    total = sum(counts.values())
+    covered = sum(count for lemma_id, count in counts.items() if lemma_id in known)
+    needed = math.ceil(coverage * total)
+    new = []
+    for lemma_id, count in counts.most_common():
+        if covered >= needed:
+            break
+        if lemma_id not in known:
+            new.append(lemma_id)
+            covered += count
+    return new
+
+
+def plan_series(passages, coverage, initial=()):
+    """
+    yield (passage, new, known, counts) for each passage in turn where new is
+    the list of lemmas to learn for it, known is the list of lemmas known
+    after learning them and counts is a Counter of lemma occurrences.
+
+    coverage is the target fraction of each passage's words that should be
+    known and initial is the lemmas known before the first passage.
+    """
+    corpus = load_corpus()
+    initial = set(initial)
+    known_ids = set()
+    known = sorted(initial, key=sort_key)
+    seen = set()
+
+    for passage in passages:
+        counts = Counter()
+        for entry in get_morphgnt(parse_verse_ranges(passage), corpus):
+            if entry[0] == "WORD":
+                counts[entry[1].lemma_id] += 1
+
+        for lemma_id in counts.keys() - seen:
+            seen.add(lemma_id)
+            if corpus.string(lemma_id) in initial:
+                known_ids.add(lemma_id)
+
+        new_ids = plan_lesson(counts, known_ids, coverage)
+        known_ids.update(new_ids)
+        new = [corpus.string(lemma_id) for lemma_id in new_ids]
+        known.extend(new)
+        yield passage, new, list(known), Counter({
+            corpus.string(lemma_id): count for lemma_id, count in counts.items()
+        })
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "passages", nargs="+",
+        help="the passage for each lesson in order (e.g. 'John 18:1-11')")
+    argparser.add_argument(
+        "--coverage", type=float, default=95,
+        help="percentage of words in each lesson that should be known "
+             "(defaults to 95)")
+    argparser.add_argument(
+        "--exclude", help="exclusion list file of lemmas known at the start")
+    argparser.add_argument(
+        "--output-dir", default=".",
+        help="directory to write the lesson files to (defaults to .)")
+    argparser.add_argument(
+        "--prefix", default="lesson",
+        help="prefix for the names of the lesson files (defaults to lesson)")
+
+    args = argparser.parse_args()
+
+    if not 0 <= args.coverage <= 100:
+        argparser.error("--coverage must be between 0 and 100")
+
+    if args.exclude:
+        initial = load_wordset(args.exclude)
+    else:
+        initial = set()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    series = plan_series(args.passages, args.coverage / 100, initial)
+    for lesson, (passage, new, known, counts) in enumerate(series, 1):
+        filename = os.path.join(
+            args.output_dir, "{}{:02d}-{{}}.txt".format(args.prefix, lesson))
+        with open(filename.format("vocab"), "w") as f:
+            f.write("".join(
+                "{}  # {}\n".format(lemma, counts[lemma]) for lemma in new))
+        with open(filename.format("exclude"), "w") as f:
+            f.write("".join("{}\n".format(lemma) for lemma in known))
+
+        known = set(known)
+        total = sum(counts.values())
+        covered = sum(count for lemma, count in counts.items() if lemma in known)
+        print_status(
+            "lesson {} ({}): {} new lemmas, {:.1f}% of {} words known".format(
+                lesson, passage, len(new), 100 * covered / max(total, 1), total))
+
+
+if __name__ == "__main__":
+    main()
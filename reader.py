@@ -1,44 +1,109 @@
 #!/usr/bin/env python3
 
 import argparse
+import bisect
+import collections.abc
+import contextlib
+import functools
+import multiprocessing
+import os
+import time
 
-from utils import (get_morphgnt, load_path_attr, load_wordset, load_yaml,
-                   parse_verse_ranges)
+from corpus import load_corpus
+from fragments import DEFAULT_MAX_BYTES, FragmentCache, backend_key, fragment_key
+from gloss_db import GlossDatabase, is_database, passage_lemmas
+from sinks import DEFAULT_CHUNK_SIZE, open_output
+from utils import (Memo, Stats, add_stats_arguments, get_morphgnt,
+                   load_path_attr, load_wordset, load_yaml, parse_verse_ranges,
+                   print_status, verse_position)
 
-argparser = argparse.ArgumentParser()
-argparser.add_argument("verses", help="verses to cover (e.g. 'John 18:1-11')")
-argparser.add_argument("--headwords", help="headwords file")
-argparser.add_argument("--glosses", help="glosses file")
-argparser.add_argument(
-    "--language", default="eng",
-    help="language of glosses and other non-Greek text (defaults to eng)")
-argparser.add_argument("--exclude", help="exclusion list file")
-argparser.add_argument(
-    "--typeface", default="Times New Roman",
-    help="typeface to use (defaults to Times New Roman)")
-argparser.add_argument(
-    "--backend", default="backends.LaTeX",
-    help="python class to use for backend (defaults to backends.LaTeX)")
+DEFAULT_BACKEND = "backends.LaTeX"
+DEFAULT_LANGUAGE = "eng"
+DEFAULT_TYPEFACE = "Times New Roman"
 
+# the settings a --target can give
+TARGET_SETTINGS = [
+    "output", "backend", "language", "typeface", "glosses", "headwords",
+    "exclude",
+]
 
-args = argparser.parse_args()
+# the settings a --batch manifest entry may give
+MANIFEST_SETTINGS = ["verses"] + TARGET_SETTINGS[1:]
 
-verses = parse_verse_ranges(args.verses)
+# the settings that name files (which, in a manifest, are relative to it)
+FILE_SETTINGS = ["glosses", "headwords", "exclude"]
 
-if args.exclude:
-    exclusions = load_wordset(args.exclude)
-else:
-    exclusions = set()
 
-if args.glosses:
-    glosses = load_yaml(args.glosses)
-else:
-    glosses = None
+class Resources:
+    """
+    the glosses, headwords and exclusions used to annotate a reader.
 
-if args.headwords:
-    headwords = load_yaml(args.headwords)
-else:
-    headwords = {}
+    glosses may be None in which case no glosses are output.
+    """
+
+    def __init__(self, glosses=None, headwords=None, exclusions=None):
+        self.glosses = glosses
+        self.headwords = headwords if headwords is not None else {}
+        self.exclusions = exclusions if exclusions is not None else set()
+
+
+class ResourceLoader:
+    """
+    loads glosses, headwords and exclusion lists, only loading each file once
+    no matter how many readers it is used for.
+
+    glosses and headwords may be YAML files or a GlossDatabase.
+    """
+
+    def __init__(self):
+        self.loaded = {}
+
+    def load(self, loader, filename):
+        key = (loader, filename)
+        if key not in self.loaded:
+            self.loaded[key] = loader(filename)
+        return self.loaded[key]
+
+    def glosses(self, filename, language=DEFAULT_LANGUAGE):
+        """
+        returns the glosses in the given file, raising ValueError if it's a
+        gloss database without any for the given language.
+        """
+        if is_database(filename):
+            glosses = self.load(GlossDatabase, filename).glosses(language)
+            if not glosses:
+                raise ValueError("no {} glosses in {}".format(language, filename))
+            return glosses
+        return self.load(load_yaml, filename)
+
+    def headwords(self, filename):
+        if is_database(filename):
+            return self.load(GlossDatabase, filename).headwords()
+        return self.load(load_yaml, filename)
+
+    def resources(
+            self, glosses=None, headwords=None, exclude=None,
+            language=DEFAULT_LANGUAGE):
+        return Resources(
+            self.glosses(glosses, language) if glosses else None,
+            self.headwords(headwords) if headwords else None,
+            self.load(load_wordset, exclude) if exclude else None,
+        )
+
+
+def prefetch(mappings, verses, lemmas=None):
+    """
+    looks up the entries of all the lemmas in the given verses (or the given
+    list of them, if already known) at once in those of the given glosses and
+    headwords that are in a GlossDatabase, rather than as each lemma is first
+    annotated.
+    """
+    mappings = [mapping for mapping in mappings if hasattr(mapping, "prefetch")]
+    if mappings:
+        if lemmas is None:
+            lemmas = passage_lemmas(verses)
+        for mapping in mappings:
+            mapping.prefetch(lemmas)
 
 
 def verb_parse(ccat_parse):
@@ -54,50 +119,946 @@ def strip_textcrit(word):
     return word.replace("⸀", "").replace("⸂", "").replace("⸃", "")
 
 
-def output_reader(verses, backend, language):
-    print(backend.preamble(args.typeface, language))
+def interval_index(ranges):
+    """
+    compiles a list of (start, end, width, gloss) for possibly overlapping
+    inclusive ranges of packed BBCCVV ints into sorted lists of the starts,
+    ends and glosses of non-overlapping intervals.
 
-    postponed_book = postponed_chapter = None
+    where ranges overlap, the narrowest (by the given width) wins (or the
+    first given if they are the same width).
+    """
+    bounds = sorted({start for start, end, width, gloss in ranges}.union(
+        end + 1 for start, end, width, gloss in ranges))
+    starts, ends, glosses = [], [], []
+    for low, high in zip(bounds, bounds[1:]):
+        covering = [
+            (width, i) for i, (start, end, width, gloss) in enumerate(ranges)
+            if start <= low and high - 1 <= end
+        ]
+        if not covering:
+            continue
+        gloss = ranges[min(covering)[1]][3]
+        if ends and ends[-1] == low - 1 and glosses[-1] == gloss:
+            ends[-1] = high - 1
+        else:
+            starts.append(low)
+            ends.append(high - 1)
+            glosses.append(gloss)
+    return starts, ends, glosses
 
-    for entry in get_morphgnt(verses):
-        if entry[0] == "WORD":
-            row = entry[1]
-            lexeme = row["lemma"]
-            text = strip_textcrit(row["text"])
-            if lexeme not in exclusions:
-                pos = row["ccat-pos"]
-                headword = headwords.get(lexeme, lexeme)
-                if glosses:
-                    gloss = glosses[lexeme].get(
-                        row["bcv"], glosses[lexeme]["default"])
-                else:
-                    gloss = None
-                if pos in ["V-"]:
-                    parse = verb_parse(row["ccat-parse"])
+
+class GlossOverrides:
+    """
+    the glosses to use for a lemma in particular verses instead of its
+    default, from the keys of its glosses entry other than default.
+
+    a key is either a BBCCVV or a passage as given to reader.py (e.g.
+    "John 18:1-11"). a gloss keyed by the BBCCVV of a verse takes precedence
+    over one for a passage including it and where passages overlap the one
+    with the fewest verses wins. the passages are compiled into an interval index so
+    looking up a verse is a bisect.
+    """
+
+    def __init__(self, lemma, entry):
+        self.verses = {}
+        ranges = []
+        for key, gloss in entry.items():
+            if key == "default":
+                continue
+            if not isinstance(key, str) or key.isdigit():
+                self.verses[key] = gloss
+                continue
+            try:
+                verses = parse_verse_ranges(key)
+            except ValueError:
+                raise ValueError(
+                    "can't parse gloss key {!r} for {}".format(key, lemma))
+            for verse_range in verses:
+                if isinstance(verse_range, tuple):
+                    start, end = verse_range
                 else:
-                    parse = None
-                print(backend.word(text, headword, parse, gloss, language), end="")
+                    start = end = verse_range
+                width = verse_position(end) - verse_position(start)
+                ranges.append((int(start), int(end), width, gloss))
+        self.starts, self.ends, self.glosses = interval_index(ranges)
+
+    def __bool__(self):
+        return bool(self.verses or self.starts)
+
+    def __contains__(self, bcv):
+        return self.get(bcv, self) is not self
+
+    def get(self, bcv, default=None):
+        """
+        returns the gloss for the given BBCCVV or default if there's no
+        override for it.
+        """
+        if bcv in self.verses:
+            return self.verses[bcv]
+        if self.starts:
+            i = bisect.bisect_right(self.starts, int(bcv)) - 1
+            if i >= 0 and int(bcv) <= self.ends[i]:
+                return self.glosses[i]
+        return default
+
+
+def gloss_entry(lemma, glosses):
+    """
+    returns a (gloss, overrides) tuple for the given lemma where overrides is
+    the GlossOverrides for the verses it should be glossed differently in (or
+    None and no overrides if glosses is None).
+    """
+    if glosses:
+        entry = glosses[lemma]
+        return entry["default"], GlossOverrides(lemma, entry)
+    else:
+        return None, {}
+
+
+def annotate(lemma, resources):
+    """
+    returns how words with the given lemma should be annotated: None if the
+    lemma is excluded and otherwise a (headword, gloss, overrides) tuple as
+    for gloss_entry.
+    """
+    if lemma in resources.exclusions:
+        return None
+    headword = resources.headwords.get(lemma, lemma)
+    return (headword,) + gloss_entry(lemma, resources.glosses)
+
+
+class Annotator:
+    """
+    works out the arguments to backend.word for rows of MorphGNT given the
+    resources, working out everything that depends only on the lemma, parse
+    code or surface text once rather than for every word.
+    """
+
+    def __init__(self, resources, language):
+        self.resources = resources
+        self.language = language
+        self.annotations = Memo(lambda lemma: annotate(lemma, resources))
+        self.parses = Memo(verb_parse)
+        self.texts = Memo(strip_textcrit)
+
+    def word_args(self, row):
+        annotation = self.annotations[row["lemma"]]
+        if annotation is None:
+            return (self.texts[row["text"]],)
+        headword, gloss, overrides = annotation
+        if overrides:
+            gloss = overrides.get(row["bcv"], gloss)
+        if row["ccat-pos"] == "V-":
+            parse = self.parses[row["ccat-parse"]]
+        else:
+            parse = None
+        return (self.texts[row["text"]], headword, parse, gloss, self.language)
+
+    def counted_word_args(self, row, counts):
+        """
+        word_args that also counts, in the Counter counts, the words, those
+        excluded, and whether each annotated word's lemma has a headword and
+        its verse a gloss override.
+        """
+        args = self.word_args(row)
+        counts["words"] += 1
+        if len(args) == 1:
+            counts["excluded words"] += 1
+            return args
+        lemma = row["lemma"]
+        if lemma in self.resources.headwords:
+            counts["headword hits"] += 1
+        else:
+            counts["headword misses"] += 1
+        if self.resources.glosses:
+            if row["bcv"] in self.annotations[lemma][2]:
+                counts["gloss override hits"] += 1
             else:
-                print(backend.word(text), end="")
+                counts["gloss override misses"] += 1
+        return args
+
+
+class SharedAnnotator:
+    """
+    works out the arguments to backend.word for rows of MorphGNT for several
+    readers at once, each with its own glosses and language but sharing the
+    headwords and exclusions of resources, so only the gloss is worked out for
+    each reader; everything else is worked out once per word for all of them.
+    """
+
+    def __init__(self, resources, targets):
+        """
+        targets is a list of (glosses, language) for each reader.
+        """
+        self.resources = resources
+        self.glossed = [bool(glosses) for glosses, language in targets]
+        self.headwords = Memo(lambda lemma: None if lemma in resources.exclusions
+                              else resources.headwords.get(lemma, lemma))
+        self.targets = [
+            (Memo(lambda lemma, glosses=glosses: gloss_entry(lemma, glosses)),
+             language)
+            for glosses, language in targets
+        ]
+        self.parses = Memo(verb_parse)
+        self.texts = Memo(strip_textcrit)
+
+    def word_args(self, row):
+        """
+        returns a list of the arguments to backend.word for each reader.
+        """
+        text = self.texts[row["text"]]
+        headword = self.headwords[row["lemma"]]
+        if headword is None:
+            return [(text,)] * len(self.targets)
+        if row["ccat-pos"] == "V-":
+            parse = self.parses[row["ccat-parse"]]
+        else:
+            parse = None
+        lemma = row["lemma"]
+        bcv = None
+        args = []
+        for glosses, language in self.targets:
+            gloss, overrides = glosses[lemma]
+            if overrides:
+                if bcv is None:
+                    bcv = row["bcv"]
+                gloss = overrides.get(bcv, gloss)
+            args.append((text, headword, parse, gloss, language))
+        return args
+
+    def counted_word_args(self, row, counts):
+        """
+        word_args that also counts, in the Counter counts, what
+        Annotator.counted_word_args does for each reader.
+        """
+        args = self.word_args(row)
+        readers = len(args)
+        counts["words"] += readers
+        if self.headwords[row["lemma"]] is None:
+            counts["excluded words"] += readers
+            return args
+        lemma = row["lemma"]
+        if lemma in self.resources.headwords:
+            counts["headword hits"] += readers
+        else:
+            counts["headword misses"] += readers
+        for (glosses, language), glossed in zip(self.targets, self.glossed):
+            if glossed:
+                if row["bcv"] in glosses[lemma][1]:
+                    counts["gloss override hits"] += 1
+                else:
+                    counts["gloss override misses"] += 1
+        return args
+
+
+def render_verse(backend, words):
+    """
+    returns the rendering of a verse's words given the list of arguments to
+    backend.word for each, using the backend's render_verse method if it has
+    one to do it all at once.
+    """
+    if hasattr(backend, "render_verse"):
+        return backend.render_verse(words)
+    return "".join(backend.word(*args) for args in words)
+
+
+def render_words(backend, words, cache=None, cache_prefix=None):
+    """
+    returns the rendering of a verse's words given the list of arguments to
+    backend.word for each, using the cache (if given) with the given key
+    prefix.
+    """
+    if cache:
+        key = fragment_key(cache_prefix, words)
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = render_verse(backend, words)
+            cache.put(key, fragment)
+        return fragment
+    return render_verse(backend, words)
+
+
+def reader_events(events, word_args):
+    """
+    yield what a backend should be called on to output the given get_morphgnt
+    events: the words of each verse as (None, rows, words) where words is
+    word_args of each of the rows, and everything else as (method, args) for
+    the backend method to call (e.g. ("verse", (1,))).
+    """
+    # the rows of the current verse and the arguments to backend.word for each
+    # so the verse can be rendered (or found in the cache) as a whole
+    rows = []
+    words = []
+
+    postponed_book = postponed_chapter = None
+
+    for entry in events:
+        if entry[0] != "WORD" and words:
+            yield None, rows, words
+            rows = []
+            words = []
+
+        if entry[0] == "WORD":
+            rows.append(entry[1])
+            words.append(word_args(entry[1]))
 
         elif entry[0] == "VERSE_START":
             if postponed_book:
-                print(backend.book_chapter_verse(
-                    postponed_book, postponed_chapter, entry[1]), end="")
+                yield "book_chapter_verse", (
+                    postponed_book, postponed_chapter, entry[1])
                 postponed_book = postponed_chapter = None
             elif postponed_chapter:
-                print(backend.chapter_verse(postponed_chapter, entry[1]), end="")
+                yield "chapter_verse", (postponed_chapter, entry[1])
                 postponed_chapter = None
             else:
-                print(backend.verse(entry[1]), end="")
+                yield "verse", (entry[1],)
         elif entry[0] == "CHAPTER_START":
             postponed_chapter = entry[1]
         elif entry[0] == "BOOK_START":
             postponed_book = entry[1]
         else:
-            print(backend.comment(entry))
+            yield "comment", (entry,)
+
+    if words:
+        yield None, rows, words
+
+
+def backend_call(backend, method, args):
+    """
+    returns the output of calling the named backend method (as yielded by
+    reader_events) with the given arguments.
+    """
+    if method == "comment":
+        return backend.comment(*args) + "\n"
+    return getattr(backend, method)(*args)
+
+
+def postamble_parts(backend):
+    postamble = backend.postamble()
+    if isinstance(postamble, collections.abc.Iterator):
+        # a long postamble can be given as an iterator of parts
+        yield from postamble
+        yield "\n"
+    else:
+        yield "{}\n".format(postamble)
+
+
+def cache_prefix(backend, language, cache):
+    """
+    returns the fragment key prefix for the given backend and language, or
+    None if its verses can't be cached.
+    """
+    # stateful backends (e.g. ones numbering footnotes) can't reuse fragments
+    if cache and getattr(backend, "cacheable", False):
+        return backend_key(backend, language)
+    return None
+
+
+def reader_parts(
+        verses, backend, language, typeface, resources, cache=None,
+        stats=None):
+    """
+    yield the text of a reader in parts: the words of each verse as a
+    (rows, text) pair where rows are the verse's MorphGNT rows, and everything
+    else (preamble, verse numbers, etc.) as plain strings.
+
+    stats is an optional (enabled) Stats to record the time spent reading the
+    text, annotating words and rendering them in.
+    """
+    prefetch([resources.glosses, resources.headwords], verses)
+    annotator = Annotator(resources, language)
+    events = get_morphgnt(verses, load_corpus())
+    word_args = annotator.word_args
+    render = render_words
+    if stats:
+        events = stats.timed("text", events, "events")
+        word_args = stats.timer("annotate", functools.partial(
+            annotator.counted_word_args, counts=stats.counts))
+        render = stats.timer("render", render_words)
+
+    prefix = cache_prefix(backend, language, cache)
+    if prefix is None:
+        cache = None
+
+    yield backend.preamble(typeface, language) + "\n"
+
+    for event in reader_events(events, word_args):
+        if event[0] is None:
+            yield event[1], render(backend, event[2], cache, prefix)
+        else:
+            yield backend_call(backend, *event)
+
+    yield from postamble_parts(backend)
+
+
+def output_reader(
+        verses, backend, language, typeface, resources, out, cache=None,
+        stats=None):
+    write = out.write
+    if stats:
+        write = stats.timer("output", write)
+    for part in reader_parts(
+            verses, backend, language, typeface, resources, cache, stats):
+        if isinstance(part, str):
+            write(part)
+        else:
+            write(part[1])
+
+
+def generate_reader(
+        verses, backend=DEFAULT_BACKEND, resources=None,
+        language=DEFAULT_LANGUAGE, typeface=DEFAULT_TYPEFACE, out=None,
+        cache=None, stats=None):
+    """
+    write a reader for the given verses to out (a file-like object, defaults
+    to stdout).
+
+    verses is either a list of verse-ranges (as taken by get_morphgnt) or a
+    string to be parsed by parse_verse_ranges (e.g. "John 18:1-11"). backend
+    is either a backend instance or the module-qualified name of a backend
+    class (e.g. "backends.SILE"). resources is a Resources instance. cache
+    is an optional FragmentCache of rendered verses and stats an optional
+    Stats to record the time spent in each stage in.
+    """
+    if isinstance(verses, str):
+        verses = parse_verse_ranges(verses)
+    if isinstance(backend, str):
+        backend = load_path_attr(backend)()
+    if out is None:
+        with open_output() as out:
+            output_reader(
+                verses, backend, language, typeface,
+                resources or Resources(), out, cache, stats)
+    else:
+        output_reader(
+            verses, backend, language, typeface,
+            resources or Resources(), out, cache, stats)
 
-    print(backend.postamble())
+
+def output_readers(verses, targets, resources, cache=None, stats=None):
+    """
+    write readers of the same verses for several targets at once, reading the
+    text and working out everything but the glosses only once for all of them.
+
+    targets is a list of (backend, language, typeface, glosses, out) for each
+    reader where glosses is a dict of glosses (or None) and out a file-like
+    object. resources gives the headwords and exclusions shared by all of them
+    (its glosses aren't used).
+    """
+    prefetch(
+        [resources.headwords] + [target[3] for target in targets], verses)
+    annotator = SharedAnnotator(resources, [
+        (glosses, language) for _, language, _, glosses, _ in targets])
+    events = get_morphgnt(verses, load_corpus())
+    word_args = annotator.word_args
+    render = render_words
+    writes = [target[4].write for target in targets]
+    if stats:
+        events = stats.timed("text", events, "events")
+        word_args = stats.timer("annotate", functools.partial(
+            annotator.counted_word_args, counts=stats.counts))
+        render = stats.timer("render", render_words)
+        writes = [stats.timer("output", write) for write in writes]
+
+    backends = [target[0] for target in targets]
+    prefixes = [
+        cache_prefix(backend, language, cache)
+        for backend, language, _, _, _ in targets
+    ]
+
+    for (backend, language, typeface, _, _), write in zip(targets, writes):
+        write(backend.preamble(typeface, language) + "\n")
+
+    for event in reader_events(events, word_args):
+        if event[0] is None:
+            # event[2] has the arguments for every reader for each word
+            for backend, prefix, write, words in zip(
+                    backends, prefixes, writes, zip(*event[2])):
+                write(render(
+                    backend, list(words), prefix and cache, prefix))
+        else:
+            for backend, write in zip(backends, writes):
+                write(backend_call(backend, *event))
+
+    for backend, write in zip(backends, writes):
+        for part in postamble_parts(backend):
+            write(part)
+
+
+class ReaderJob:
+    """
+    a single reader to generate: the verses, where to write it and any
+    settings that differ from the defaults.
+    """
+
+    def __init__(
+            self, verses, output, backend=DEFAULT_BACKEND,
+            language=DEFAULT_LANGUAGE, typeface=DEFAULT_TYPEFACE,
+            glosses=None, headwords=None, exclude=None,
+            chunk_size=DEFAULT_CHUNK_SIZE):
+        self.verses = verses
+        self.output = output
+        self.backend = backend
+        self.language = language
+        self.typeface = typeface
+        self.glosses = glosses
+        self.headwords = headwords
+        self.exclude = exclude
+        self.chunk_size = chunk_size
+
+    def run(self, loader, cache=None, stats=None):
+        with stats.stage("resources") if stats else contextlib.nullcontext():
+            resources = loader.resources(
+                self.glosses, self.headwords, self.exclude, self.language)
+        with open_output(self.output, self.chunk_size) as f:
+            generate_reader(
+                self.verses, self.backend, resources,
+                self.language, self.typeface, f, cache, stats)
+
+
+def load_manifest(filename, defaults):
+    """
+    returns a list of ReaderJobs from the given YAML batch manifest.
+
+    the manifest maps each output filename either to the verses to cover or to
+    a mapping with "verses" and any of "backend", "language", "typeface",
+    "glosses", "headwords" or "exclude", e.g.
+
+        john18.tex: John 18:1-11
+        john18.sil:
+            verses: John 18:1-11
+            backend: backends.SILE
+
+    settings not given for an entry are taken from defaults. files named in
+    the manifest are relative to the directory it is in. raises ValueError
+    naming the entry if it has an unknown setting or no verses.
+    """
+    directory = os.path.dirname(filename)
+    jobs = []
+    for output, entry in load_yaml(filename).items():
+        if not isinstance(entry, dict):
+            entry = {"verses": entry}
+        for key in entry:
+            if key not in MANIFEST_SETTINGS:
+                raise ValueError("unknown setting {!r} for {} in {}".format(
+                    key, output, filename))
+        if not entry.get("verses"):
+            raise ValueError("no verses for {} in {}".format(output, filename))
+        for key in FILE_SETTINGS:
+            if entry.get(key):
+                entry[key] = os.path.join(directory, entry[key])
+        settings = dict(defaults)
+        settings.update(entry)
+        jobs.append(ReaderJob(output=output, **settings))
+    return jobs
+
+
+def group_jobs(jobs):
+    """
+    returns the given ReaderJobs as a list of lists of jobs that can be run
+    together (those for the same verses, headwords and exclusions) in the
+    order of the first job of each.
+    """
+    groups = {}
+    for job in jobs:
+        key = (repr(job.verses), job.headwords, job.exclude)
+        groups.setdefault(key, []).append(job)
+    return list(groups.values())
+
+
+def run_group(jobs, loader, cache=None, stats=None):
+    """
+    run the given ReaderJobs, which must be for the same verses, headwords and
+    exclusions, with a single pass over the text for all of them.
+    """
+    if len(jobs) == 1:
+        jobs[0].run(loader, cache, stats)
+        return
+
+    first = jobs[0]
+    with stats.stage("resources") if stats else contextlib.nullcontext():
+        resources = loader.resources(None, first.headwords, first.exclude)
+        glosses = [
+            loader.glosses(job.glosses, job.language) if job.glosses else None
+            for job in jobs
+        ]
+    verses = first.verses
+    if isinstance(verses, str):
+        verses = parse_verse_ranges(verses)
+
+    with contextlib.ExitStack() as stack:
+        targets = []
+        for job, job_glosses in zip(jobs, glosses):
+            backend = job.backend
+            if isinstance(backend, str):
+                backend = load_path_attr(backend)()
+            out = stack.enter_context(open_output(job.output, job.chunk_size))
+            targets.append(
+                (backend, job.language, job.typeface, job_glosses, out))
+        output_readers(verses, targets, resources, cache, stats)
+
+
+def target_job(target, verses, defaults):
+    """
+    returns a ReaderJob for the given verses from a --target option: comma-
+    separated key=value pairs giving the output and any of "backend",
+    "language", "typeface", "glosses", "headwords" or "exclude", e.g.
+
+        output=john18.sil,backend=backends.SILE
+
+    settings not given are taken from defaults.
+    """
+    settings = dict(defaults)
+    for pair in target.split(","):
+        key, sep, value = pair.partition("=")
+        key = key.strip()
+        if not sep or key not in TARGET_SETTINGS:
+            raise ValueError("can't parse target {!r}".format(target))
+        settings[key] = value.strip()
+    if "output" not in settings:
+        raise ValueError("target {!r} has no output".format(target))
+    return ReaderJob(verses=verses, **settings)
+
+
+# the loader and cache used by worker processes; when workers are forked the
+# loader is inherited from the parent with everything already loaded
+_loader = _cache = None
+
+
+def _init_worker(loader, cache):
+    global _loader, _cache
+    _loader, _cache = loader, cache
+
+
+def _run_group(jobs):
+    run_group(jobs, _loader, _cache)
+    return [job.output for job in jobs]
+
+
+def run_jobs(jobs, loader, num_processes=1, cache=None, stats=None):
+    """
+    run the given ReaderJobs, spreading them across a pool of num_processes
+    worker processes if greater than one, and yield each output filename as
+    its reader is written. cache is an optional FragmentCache.
+
+    jobs for the same verses, headwords and exclusions are run together (see
+    group_jobs) with a single pass over the text.
+
+    everything the jobs need is loaded before the pool is started so, where
+    processes can be forked, the workers share it rather than loading it again.
+    stats is an optional Stats but, with more than one process, only covers
+    that loading (the rest being in the workers).
+    """
+    groups = group_jobs(jobs)
+
+    if num_processes <= 1:
+        for group in groups:
+            run_group(group, loader, cache, stats)
+            for job in group:
+                yield job.output
+        return
+
+    with stats.stage("resources") if stats else contextlib.nullcontext():
+        for job in jobs:
+            loader.resources(
+                job.glosses, job.headwords, job.exclude, job.language)
+    load_corpus()
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+
+    with context.Pool(num_processes, _init_worker, (loader, cache)) as pool:
+        for outputs in pool.imap(_run_group, groups):
+            yield from outputs
+
+
+def changed_keys(old, new):
+    """
+    returns the set of keys whose entries differ between two mappings (or
+    sets), or None if everything should be treated as changed (because one of
+    them is None and the other isn't).
+    """
+    if old is None or new is None:
+        return None if old is not new else set()
+    if isinstance(old, (set, frozenset)):
+        return set(old ^ new)
+    return {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+
+
+class WatchedReader:
+    """
+    a reader written to a file and kept up-to-date as its glosses, headwords
+    and exclusion files change.
+
+    when they change, only the verses containing a lemma whose entries changed
+    are rendered again (unless the backend is stateful, in which case the
+    whole reader is).
+    """
+
+    def __init__(
+            self, verses, backend, language, typeface, output,
+            glosses=None, headwords=None, exclude=None):
+        self.verses = parse_verse_ranges(verses)
+        self.backend_class = load_path_attr(backend)
+        self.language = language
+        self.typeface = typeface
+        self.output = output
+        self.filenames = [glosses, headwords, exclude]
+        self.mtimes = self.stat()
+        self.render(self.load())
+
+    def stat(self):
+        return [
+            os.stat(filename).st_mtime_ns if filename else None
+            for filename in self.filenames
+        ]
+
+    def load(self):
+        resources = ResourceLoader().resources(*self.filenames, self.language)
+        # a gloss database is otherwise read as it's used so read all of it
+        # now to have something to compare against when it changes
+        for mapping in [resources.glosses, resources.headwords]:
+            if hasattr(mapping, "load_all"):
+                mapping.load_all()
+        return resources
+
+    def render(self, resources):
+        """
+        renders the whole reader with the given resources, only keeping them
+        (and the rendering) if it succeeds.
+        """
+        backend = self.backend_class()
+        parts = list(reader_parts(
+            self.verses, backend, self.language, self.typeface, resources))
+        self.backend = backend
+        self.parts = parts
+        self.resources = resources
+        self.lemmas = {
+            i: {row["lemma"] for row in part[0]}
+            for i, part in enumerate(self.parts) if not isinstance(part, str)
+        }
+        self.write()
+
+    def write(self):
+        directory, basename = os.path.split(self.output)
+        # a hidden temporary file keeps the suffix, so compression still works
+        tmp = os.path.join(directory, "." + basename)
+        with open_output(tmp) as out:
+            for part in self.parts:
+                out.write(part if isinstance(part, str) else part[1])
+        os.replace(tmp, self.output)
+
+    def update(self):
+        """
+        reloads the resources and renders again whatever they affect,
+        returning the number of verses rendered again (or None if the whole
+        reader was).
+
+        if rendering fails, the reader and the resources it was rendered with
+        are left as they were, so the next update still renders again
+        everything changed since then.
+        """
+        resources = self.load()
+        changed = set()
+        for name in ["glosses", "headwords", "exclusions"]:
+            keys = changed_keys(
+                getattr(self.resources, name), getattr(resources, name))
+            if keys is None:
+                changed = None
+                break
+            changed.update(keys)
+
+        if changed is None or not getattr(self.backend, "cacheable", False):
+            self.render(resources)
+            return None
+
+        annotator = Annotator(resources, self.language)
+        parts = list(self.parts)
+        updated = 0
+        for i, lemmas in self.lemmas.items():
+            if not changed.isdisjoint(lemmas):
+                rows = parts[i][0]
+                parts[i] = (rows, render_words(
+                    self.backend, [annotator.word_args(row) for row in rows]))
+                updated += 1
+        self.parts = parts
+        self.resources = resources
+        if updated:
+            self.write()
+        return updated
+
+    def watch(self, interval):
+        """
+        polls the resource files every interval seconds, updating the reader
+        when any change, until interrupted.
+        """
+        while True:
+            time.sleep(interval)
+            try:
+                mtimes = self.stat()
+                if mtimes == self.mtimes:
+                    continue
+                self.mtimes = mtimes
+                updated = self.update()
+            except Exception as e:
+                # most likely a mistake in a file being edited so keep watching
+                print_status("couldn't update {}: {!r}".format(self.output, e))
+                continue
+            if updated is None:
+                print_status("rewrote {}".format(self.output))
+            else:
+                print_status("updated {} verses in {}".format(
+                    updated, self.output))
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "verses", nargs="?", help="verses to cover (e.g. 'John 18:1-11')")
+    argparser.add_argument(
+        "--headwords", help="headwords file (YAML or a gloss database)")
+    argparser.add_argument(
+        "--glosses",
+        help="glosses file (YAML or a gloss database, from which the glosses "
+             "for --language are used)")
+    argparser.add_argument(
+        "--language", default=DEFAULT_LANGUAGE,
+        help="language of glosses and other non-Greek text (defaults to eng)")
+    argparser.add_argument("--exclude", help="exclusion list file")
+    argparser.add_argument(
+        "--typeface", default=DEFAULT_TYPEFACE,
+        help="typeface to use (defaults to Times New Roman)")
+    argparser.add_argument(
+        "--backend", default=DEFAULT_BACKEND,
+        help="python class to use for backend (defaults to backends.LaTeX)")
+    argparser.add_argument(
+        "--batch",
+        help="YAML manifest of readers to generate (in place of verses)")
+    argparser.add_argument(
+        "--output",
+        help="file to write the reader to (defaults to stdout); it is "
+             "compressed if the name ends in .gz, .bz2 or .xz")
+    argparser.add_argument(
+        "--target", action="append", dest="targets", metavar="SETTINGS",
+        help="file to write a reader to along with any settings that differ "
+             "from the other options, as comma-separated key=value pairs "
+             "(e.g. output=john.sil,backend=backends.SILE,language=fra,"
+             "glosses=fra.yaml); any number of times, reading the text once "
+             "for all of them")
+    argparser.add_argument(
+        "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+        help="number of characters to buffer between writes "
+             "(defaults to {})".format(DEFAULT_CHUNK_SIZE))
+    argparser.add_argument(
+        "--jobs", type=int, default=1,
+        help="number of processes to use with --batch or --target (defaults "
+             "to 1)")
+    argparser.add_argument(
+        "--watch", action="store_true",
+        help="keep running, updating --output whenever the glosses, "
+             "headwords or exclusion files change")
+    argparser.add_argument(
+        "--watch-interval", type=float, default=1.0,
+        help="seconds between checks for changes with --watch "
+             "(defaults to 1)")
+    argparser.add_argument(
+        "--cache",
+        help="directory in which to cache rendered verses so unchanged verses "
+             "don't need rendering again")
+    argparser.add_argument(
+        "--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="maximum size of the --cache directory in MB (defaults to "
+             "{})".format(DEFAULT_MAX_BYTES // (1024 * 1024)))
+    add_stats_arguments(argparser)
+
+    args = argparser.parse_args()
+
+    if bool(args.verses) == bool(args.batch):
+        argparser.error("either verses or --batch (but not both) is required")
+
+    if args.watch and (args.batch or not args.output):
+        argparser.error("--watch requires verses and --output")
+
+    if args.targets and (args.batch or args.watch or args.output):
+        argparser.error("--target can't be used with --batch, --watch or --output")
+
+    if args.jobs > 1 and not (args.batch or args.targets):
+        argparser.error("--jobs requires --batch or --target")
+
+    if args.watch and (args.stats or args.stats_json or args.profile):
+        argparser.error("--stats and --profile can't be used with --watch")
+
+    stats = Stats(args.stats or bool(args.stats_json), args.profile)
+
+    loader = ResourceLoader()
+
+    if args.cache:
+        cache = FragmentCache(args.cache, args.cache_size * 1024 * 1024)
+    else:
+        cache = None
+
+    try:
+        with stats.stage("corpus"):
+            load_corpus()
+
+        if args.watch:
+            try:
+                reader = WatchedReader(
+                    args.verses, args.backend, args.language, args.typeface,
+                    args.output, args.glosses, args.headwords, args.exclude)
+            except ValueError as e:
+                argparser.error(str(e))
+            print_status("wrote {}, watching for changes".format(args.output))
+            try:
+                reader.watch(args.watch_interval)
+            except KeyboardInterrupt:
+                pass
+        elif args.batch or args.targets:
+            defaults = {
+                "backend": args.backend,
+                "language": args.language,
+                "typeface": args.typeface,
+                "glosses": args.glosses,
+                "headwords": args.headwords,
+                "exclude": args.exclude,
+                "chunk_size": args.chunk_size,
+            }
+            try:
+                if args.batch:
+                    jobs = load_manifest(args.batch, defaults)
+                else:
+                    jobs = [
+                        target_job(target, args.verses, defaults)
+                        for target in args.targets
+                    ]
+            except ValueError as e:
+                argparser.error(str(e))
+            try:
+                for output in run_jobs(jobs, loader, args.jobs, cache, stats):
+                    print_status("wrote {}".format(output))
+            except ValueError as e:
+                argparser.error(str(e))
+        else:
+            with stats.stage("resources"):
+                try:
+                    resources = loader.resources(
+                        args.glosses, args.headwords, args.exclude,
+                        args.language)
+                except ValueError as e:
+                    argparser.error(str(e))
+            with open_output(args.output, args.chunk_size) as out:
+                generate_reader(
+                    args.verses, args.backend, resources,
+                    args.language, args.typeface, out, cache, stats)
+    finally:
+        if cache:
+            stats.counts["fragment cache hits"] += cache.hits
+            stats.counts["fragment cache misses"] += cache.misses
+        stats.finish(args.stats_json)
 
 
-output_reader(verses, load_path_attr(args.backend)(), args.language)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+
+"""
+A long-running reader service.
+
+Readers are requested over HTTP (on a TCP port or a local Unix socket) with a
+GET of /reader and the same settings as reader.py as query parameters, e.g.
+
+    /reader?verses=John+18:1-11&backend=backends.SILE&glosses=glosses.yaml
+
+and the rendered reader is streamed back as it is generated (the response
+only starting once the first chunk has been rendered, so a reader that can't
+be rendered gets an error status rather than a truncated body). The corpus is
+loaded once at startup and each glosses, headwords and exclusion file is kept
+loaded, only being reloaded when its modification time changes. Files must be
+within the --root directory.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import threading
+import urllib.parse
+
+from corpus import load_corpus
+from gloss_db import passage_lemmas
+from reader import (DEFAULT_BACKEND, DEFAULT_LANGUAGE, DEFAULT_TYPEFACE,
+                    ResourceLoader, annotate, generate_reader, prefetch)
+from sinks import DEFAULT_CHUNK_SIZE, BufferedSink
+from utils import load_path_attr, parse_verse_ranges, print_status
+
+DEFAULT_BACKENDS = ["backends.LaTeX", "backends.SILE", "backends.MARKDOWN"]
+
+# the most chunks of a reader rendered ahead of a client reading them
+QUEUE_SIZE = 16
+
+
+class ReloadingResourceLoader(ResourceLoader):
+    """
+    a ResourceLoader that loads a file again if it has been modified since it
+    was last loaded.
+
+    requests are handled in several threads at once so loading is done under a
+    lock.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def resources(self, *args, **kwargs):
+        with self.lock:
+            return super().resources(*args, **kwargs)
+
+    def load(self, loader, filename):
+        key = (loader, filename)
+        mtime = os.stat(filename).st_mtime_ns
+        if key not in self.loaded or self.loaded[key][0] != mtime:
+            self.loaded[key] = (mtime, loader(filename))
+            print_status("loaded {}".format(filename))
+        return self.loaded[key][1]
+
+
+class QueueWriter:
+    """
+    file-like object, written to from a worker thread, that passes each write
+    on to an asyncio queue as UTF-8 bytes, followed by None when it's closed
+    or the exception if writing fails.
+
+    the queue should be bounded so a write blocks while it is full, keeping
+    the rendering no further ahead of the client than that. once cancelled
+    (from the event loop), writes raise ConnectionError instead.
+    """
+
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+        self.cancelled = False
+
+    def put(self, item):
+        if self.cancelled:
+            raise ConnectionError("response abandoned")
+        asyncio.run_coroutine_threadsafe(
+            self.queue.put(item), self.loop).result()
+
+    def write(self, s):
+        if s:
+            self.put(s.encode("utf-8"))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.cancelled:
+            self.put(None)
+
+    def fail(self, e):
+        if not self.cancelled:
+            self.put(e)
+
+    def cancel(self):
+        """
+        stops any further writes and empties the queue so a write waiting on
+        it can finish.
+        """
+        self.cancelled = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class BadRequest(Exception):
+    pass
+
+
+def drop_connection(writer):
+    """
+    closes the connection without ending the response normally (resetting
+    it, over TCP) so a client can tell the response is incomplete.
+    """
+    sock = writer.get_extra_info("socket")
+    if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    writer.transport.abort()
+
+
+class ReaderService:
+
+    def __init__(self, root, backends, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.root = os.path.realpath(root)
+        self.backends = {name: load_path_attr(name) for name in backends}
+        self.chunk_size = chunk_size
+        self.loader = ReloadingResourceLoader()
+
+    def path(self, params, name):
+        if name not in params:
+            return None
+        path = os.path.realpath(os.path.join(self.root, params[name]))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise BadRequest("{} must be within the root directory".format(name))
+        if not os.path.isfile(path):
+            raise BadRequest("no such {} file".format(name))
+        return path
+
+    def job(self, target):
+        """
+        returns the arguments for generate_reader (other than out) from the
+        request target, raising BadRequest if they aren't valid.
+        """
+        url = urllib.parse.urlsplit(target)
+        if url.path != "/reader":
+            raise BadRequest("unknown path")
+        params = {
+            name: values[-1]
+            for name, values in urllib.parse.parse_qs(url.query).items()
+        }
+        if "verses" not in params:
+            raise BadRequest("verses is required")
+        try:
+            verses = parse_verse_ranges(params["verses"])
+        except ValueError as e:
+            raise BadRequest(str(e))
+        backend = params.get("backend", DEFAULT_BACKEND)
+        if backend not in self.backends:
+            raise BadRequest("unknown backend")
+        language = params.get("language", DEFAULT_LANGUAGE)
+        resources = self.loader.resources(
+            self.path(params, "glosses"),
+            self.path(params, "headwords"),
+            self.path(params, "exclude"),
+            language,
+        )
+        # check every word can be annotated before anything is rendered
+        lemmas = passage_lemmas(verses)
+        prefetch([resources.glosses, resources.headwords], verses, lemmas)
+        try:
+            for lemma in lemmas:
+                annotate(lemma, resources)
+        except KeyError as e:
+            raise BadRequest("no gloss for {}".format(e.args[0]))
+        return (
+            verses, self.backends[backend](), resources, language,
+            params.get("typeface", DEFAULT_TYPEFACE),
+        )
+
+    def render(self, args, writer):
+        out = BufferedSink(writer, self.chunk_size, close_file=False)
+        try:
+            generate_reader(*args, out=out)
+            out.flush()
+        except ConnectionError:
+            pass  # the client went away
+        except Exception as e:
+            print_status("error rendering reader: {!r}".format(e))
+            writer.fail(e)
+        else:
+            writer.close()
+
+    def respond(self, writer, status, message):
+        writer.write(
+            "HTTP/1.0 {}\r\n"
+            "Content-Type: text/plain; charset=utf-8\r\n\r\n"
+            "{}\n".format(status, message).encode("utf-8"))
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            while (await reader.readline()).strip():
+                pass  # headers aren't needed
+            loop = asyncio.get_running_loop()
+            try:
+                method, target, version = request_line.split(" ", 2)
+                if method != "GET":
+                    raise BadRequest("only GET is supported")
+                # loading resources can take a while so keep it off the loop
+                args = await loop.run_in_executor(None, self.job, target)
+            except (ValueError, BadRequest) as e:
+                self.respond(writer, "400 Bad Request", e)
+                return
+            except Exception as e:
+                print_status("error loading resources: {!r}".format(e))
+                self.respond(writer, "500 Internal Server Error", e)
+                return
+
+            queue = asyncio.Queue(QUEUE_SIZE)
+            queue_writer = QueueWriter(loop, queue)
+            rendering = loop.run_in_executor(
+                None, self.render, args, queue_writer)
+            try:
+                await self.stream(writer, version, queue)
+            finally:
+                # if the client went away, stop rendering for it
+                queue_writer.cancel()
+                await rendering
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def stream(self, writer, version, queue):
+        """
+        sends the response for a reader being rendered into the given queue.
+        """
+        chunk = await queue.get()
+        if isinstance(chunk, Exception):
+            self.respond(writer, "500 Internal Server Error", chunk)
+            return
+
+        # HTTP/1.1 clients get the reader in chunks so, if rendering
+        # fails part way, the missing last chunk shows it's incomplete
+        chunked = version.strip() == "HTTP/1.1"
+        if chunked:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; charset=utf-8\r\n"
+                b"Transfer-Encoding: chunked\r\n"
+                b"Connection: close\r\n\r\n")
+        else:
+            writer.write(
+                b"HTTP/1.0 200 OK\r\n"
+                b"Content-Type: text/plain; charset=utf-8\r\n\r\n")
+        while chunk is not None:
+            if isinstance(chunk, Exception):
+                drop_connection(writer)
+                break
+            if chunked:
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            else:
+                writer.write(chunk)
+            await writer.drain()
+            chunk = await queue.get()
+        else:
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+
+
+async def serve(service, host, port, socket_path):
+    if socket_path:
+        server = await asyncio.start_unix_server(service.handle, socket_path)
+        print_status("serving readers on {}".format(socket_path))
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        print_status("serving readers on http://{}:{}/reader".format(host, port))
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "--host", default="127.0.0.1",
+        help="address to listen on (defaults to 127.0.0.1)")
+    argparser.add_argument(
+        "--port", type=int, default=8000,
+        help="port to listen on (defaults to 8000)")
+    argparser.add_argument(
+        "--socket", help="Unix socket to listen on instead of a port")
+    argparser.add_argument(
+        "--root", default=".",
+        help="directory that glosses, headwords and exclusion files are "
+             "given relative to (defaults to .)")
+    argparser.add_argument(
+        "--backend", action="append", dest="backends",
+        help="backend that may be requested, any number of times (defaults "
+             "to {})".format(", ".join(DEFAULT_BACKENDS)))
+
+    args = argparser.parse_args()
+
+    load_corpus()
+    service = ReaderService(args.root, args.backends or DEFAULT_BACKENDS)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
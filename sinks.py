@@ -0,0 +1,76 @@
+"""
+Buffered output for readers.
+
+Backends return many small strings (one per word, verse number, etc.) so
+rather than writing each one, they are collected and written in chunks.
+"""
+
+import bz2
+import gzip
+import lzma
+import sys
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+COMPRESSED_OPENERS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+
+
+class BufferedSink:
+    """
+    file-like object that collects the strings written to it and passes them
+    on to the underlying file f in chunks of at least chunk_size characters.
+
+    if close_file is True, f is closed when the sink is.
+    """
+
+    def __init__(self, f, chunk_size=DEFAULT_CHUNK_SIZE, close_file=True):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.close_file = close_file
+        self.parts = []
+        self.size = 0
+
+    def write(self, s):
+        self.parts.append(s)
+        self.size += len(s)
+        if self.size >= self.chunk_size:
+            self.flush()
+        return len(s)
+
+    def flush(self):
+        if self.parts:
+            self.f.write("".join(self.parts))
+            self.parts = []
+            self.size = 0
+
+    def close(self):
+        self.flush()
+        if self.close_file:
+            self.f.close()
+        else:
+            self.f.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_output(filename=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    returns a BufferedSink writing to the given filename or, if None, stdout.
+
+    filenames ending in .gz, .bz2 or .xz are written compressed.
+    """
+    if filename is None:
+        return BufferedSink(sys.stdout, chunk_size, close_file=False)
+    for suffix, opener in COMPRESSED_OPENERS.items():
+        if filename.endswith(suffix):
+            return BufferedSink(
+                opener(filename, "wt", encoding="utf-8"), chunk_size)
+    return BufferedSink(open(filename, "w", encoding="utf-8"), chunk_size)
@@ -1,12 +1,170 @@
+import bisect
+import collections
+import collections.abc
+import contextlib
+import cProfile
+import functools
+import hashlib
 import importlib
-import re
+import json
+import marshal
+import os
 import sys
+import time
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import pysblgnt
 import yaml
-from pysblgnt import morphgnt_rows
+from pysblgnt import morphgnt_filename
 from pyuca import Collator
 
-collator = Collator()
+LEXEMES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexemes.yaml")
+
+CACHE_DIR = os.environ.get(
+    "GREEK_READER_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+MORPHGNT_FIELDS = (
+    "bcv", "ccat-pos", "ccat-parse", "robinson", "text", "word", "norm", "lemma"
+)
+
+# a MorphGNT row as a tuple (with the BBCCVV as a packed int) for iter_morphgnt
+WordRecord = collections.namedtuple(
+    "WordRecord", [field.replace("-", "_") for field in MORPHGNT_FIELDS])
+
+# the events yielded by get_morphgnt (as these strings) and iter_morphgnt (as
+# the index of each as an int)
+EVENT_NAMES = (
+    "VERSE_RANGE_START", "VERSE_RANGE_END", "BOOK_START", "BOOK_END",
+    "BOOK_END_PARTIAL", "CHAPTER_START", "CHAPTER_END", "CHAPTER_END_PARTIAL",
+    "VERSE_START", "VERSE_END", "WORD", "WORDS",
+)
+EVENT_CODES = range(len(EVENT_NAMES))
+(VERSE_RANGE_START, VERSE_RANGE_END, BOOK_START, BOOK_END, BOOK_END_PARTIAL,
+ CHAPTER_START, CHAPTER_END, CHAPTER_END_PARTIAL, VERSE_START, VERSE_END,
+ WORD, WORDS) = EVENT_CODES
+
+
+def cache_filename(name, sources):
+    """
+    returns the path of the cache file for name built from the given sources.
+
+    the path includes a digest of the path, size and modification time of each
+    source file so a change to any of them results in a new cache file.
+    """
+    digest = hashlib.sha1("{}\n".format(marshal.version).encode("utf-8"))
+    for source in sources:
+        st = os.stat(source)
+        digest.update("{}:{}:{}\n".format(
+            os.path.abspath(source), st.st_size, st.st_mtime_ns).encode("utf-8"))
+    return os.path.join(CACHE_DIR, "{}-{}".format(name, digest.hexdigest()[:16]))
+
+
+def write_cache_file(filename, data):
+    """
+    atomically writes data to the given cache file and removes any stale cache
+    files with the same name.
+
+    failure to write (e.g. a read-only cache directory) is not an error, the
+    data just won't be cached.
+    """
+    directory, basename = os.path.split(filename)
+    name = basename.rsplit("-", 1)[0]
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp = "{}.{}.tmp".format(filename, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, filename)
+        for other in os.listdir(directory):
+            if other != basename and other.rsplit("-", 1)[0] == name:
+                os.remove(os.path.join(directory, other))
+    except OSError:
+        pass
+
+
+def cached(name, sources, build):
+    """
+    returns the result of build(), memoized on disk under the given name until
+    any of the source files changes.
+
+    the result must be serializable with marshal.
+    """
+    filename = cache_filename(name, sources)
+    try:
+        with open(filename, "rb") as f:
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    value = build()
+    write_cache_file(filename, marshal.dumps(value))
+    return value
+
+
+def morphgnt_path(book_num):
+    """
+    returns the full path of the MorphGNT file for the given book number.
+    """
+    return os.path.join(
+        os.path.dirname(pysblgnt.__file__), morphgnt_filename(book_num))
+
+
+def build_verse_offsets(book_num):
+    """
+    returns a dict mapping each BBCCVV in the given book number to the byte
+    offset of its first row in the MorphGNT file.
+    """
+    offsets = {}
+    offset = 0
+    with open(morphgnt_path(book_num), "rb") as f:
+        for line in f:
+            bcv = line[:6].decode("ascii")
+            if bcv not in offsets:
+                offsets[bcv] = offset
+            offset += len(line)
+    return offsets
+
+
+@functools.lru_cache(maxsize=None)
+def verse_offsets(book_num):
+    """
+    returns the verse-offset index for the given book number.
+
+    the index is built on first use and cached on disk until the MorphGNT file
+    changes.
+    """
+    return cached(
+        "verse-offsets-{:02d}".format(book_num), [morphgnt_path(book_num)],
+        lambda: build_verse_offsets(book_num))
+
+
+def morphgnt_rows(book_num, offset=0):
+    """
+    yield a dict for each MorphGNT row in the given book number, starting at
+    the given byte offset (as found in the verse-offset index).
+    """
+    with open(morphgnt_path(book_num), "rb") as f:
+        f.seek(offset)
+        for line in f:
+            yield dict(zip(MORPHGNT_FIELDS, line.decode("utf-8").split()))
+
+
+def morphgnt_records(book_num, offset=0):
+    """
+    yield a WordRecord for each MorphGNT row in the given book number,
+    starting at the given byte offset (as found in the verse-offset index).
+    """
+    make = WordRecord._make
+    with open(morphgnt_path(book_num), "rb") as f:
+        f.seek(offset)
+        for line in f:
+            fields = line.decode("utf-8").split()
+            fields[0] = int(fields[0])
+            yield make(fields)
 
 
 def bcv_tuple(bcv):
@@ -18,23 +176,35 @@ def bcv_tuple(bcv):
     return (int(i) for i in [bcv[0:2], bcv[2:4], bcv[4:6]])
 
 
-def get_morphgnt(verses):
-    """
-    yield entries from MorphGNT for the given verses.
+def row_bcv(row):
+    bcv = row["bcv"]
+    return int(bcv[0:2]), int(bcv[2:4]), int(bcv[4:6])
 
-    verses is a list of verse-ranges where a verse-range is either a single
-    verse-id or a tuple (start-verse-id, end-verse-id). A verse-id is the
-    BBCCVV (book-chapter-verse) code used in the first column of MorphGNT.
 
-    e.g. [("012801", "012815")] will yield Matthew 28:1-15.
+def record_bcv(record):
+    bcv = record.bcv
+    return bcv // 10000, bcv // 100 % 100, bcv % 100
+
+
+def morphgnt_events(verses, book_rows, bcv, tags):
     """
+    the traversal shared by get_morphgnt and iter_morphgnt: yield (tag, value)
+    events for the given verses.
+
+    book_rows(book_num, start) returns the rows of a book starting at the given
+    BBCCVV (or the start of the book if None or not found), bcv(row) returns a
+    row's book, chapter and verse numbers and tags gives the tag for each event
+    code (e.g. tags[VERSE_START]).
+    """
+    word = tags[WORD]
+
     for verse_range in verses:
         if isinstance(verse_range, (list, tuple)):
             start, end = verse_range
         else:
             start = end = verse_range
 
-        yield("VERSE_RANGE_START", (start, end))
+        yield(tags[VERSE_RANGE_START], (start, end))
 
         start_book, start_chapter, start_verse = bcv_tuple(start)
         end_book, end_chapter, end_verse = bcv_tuple(end)
@@ -43,12 +213,14 @@ def get_morphgnt(verses):
 
         for book_num in range(start_book, end_book + 1):
 
-            yield("BOOK_START", book_num)
+            yield(tags[BOOK_START], book_num)
 
             prev_chapter = prev_verse = None
 
-            for row in morphgnt_rows(book_num):
-                b, c, v = bcv_tuple(row["bcv"])
+            rows = book_rows(book_num, start if book_num == start_book else None)
+
+            for row in rows:
+                b, c, v = bcv(row)
                 if state == 0:
                     if (start_book, start_chapter, start_verse) == (b, c, v):
                         state = 1
@@ -66,31 +238,93 @@ def get_morphgnt(verses):
                 if c != prev_chapter:
                     if prev_chapter:
                         if prev_verse:
-                            yield("VERSE_END", prev_verse)
-                        yield("CHAPTER_END", prev_chapter)
-                    yield("CHAPTER_START", c)
+                            yield(tags[VERSE_END], prev_verse)
+                        yield(tags[CHAPTER_END], prev_chapter)
+                    yield(tags[CHAPTER_START], c)
                     prev_chapter = c
                     prev_verse = None
 
                 if v != prev_verse:
                     if prev_verse:
-                        yield("VERSE_END", prev_verse)
-                    yield("VERSE_START", v)
+                        yield(tags[VERSE_END], prev_verse)
+                    yield(tags[VERSE_START], v)
                     prev_verse = v
 
-                yield ("WORD", row)
+                yield (word, row)
 
             if state == 2:
-                yield("VERSE_END", prev_verse)
-                yield("CHAPTER_END_PARTIAL", prev_chapter)
-                yield("BOOK_END_PARTIAL", book_num)
+                yield(tags[VERSE_END], prev_verse)
+                yield(tags[CHAPTER_END_PARTIAL], prev_chapter)
+                yield(tags[BOOK_END_PARTIAL], book_num)
                 break
 
-            yield("VERSE_END", v)
-            yield("CHAPTER_END", c)
-            yield("BOOK_END", book_num)
+            yield(tags[VERSE_END], v)
+            yield(tags[CHAPTER_END], c)
+            yield(tags[BOOK_END], book_num)
+
+        yield(tags[VERSE_RANGE_END], (start, end))
+
+
+def get_morphgnt(verses, corpus=None):
+    """
+    yield entries from MorphGNT for the given verses.
+
+    verses is a list of verse-ranges where a verse-range is either a single
+    verse-id or a tuple (start-verse-id, end-verse-id). A verse-id is the
+    BBCCVV (book-chapter-verse) code used in the first column of MorphGNT.
+
+    e.g. [("012801", "012815")] will yield Matthew 28:1-15.
+
+    if a corpus.Corpus is given, rows are read from it rather than from the
+    MorphGNT text files.
+    """
+    def book_rows(book_num, start):
+        if corpus:
+            return corpus.rows(book_num, start)
+        elif start:
+            # seek straight to the first row of the range
+            return morphgnt_rows(book_num, verse_offsets(book_num).get(start, 0))
+        else:
+            return morphgnt_rows(book_num)
+
+    return morphgnt_events(verses, book_rows, row_bcv, EVENT_NAMES)
+
 
-        yield("VERSE_RANGE_END", (start, end))
+def iter_morphgnt(verses, corpus=None):
+    """
+    yield (code, value) events for the given verses as get_morphgnt does but
+    with integer event codes (VERSE_START, WORD, etc.) rather than strings and
+    each word as a WordRecord rather than a dict.
+    """
+    def book_rows(book_num, start):
+        if corpus:
+            return corpus.records(book_num, start)
+        elif start:
+            return morphgnt_records(
+                book_num, verse_offsets(book_num).get(start, 0))
+        else:
+            return morphgnt_records(book_num)
+
+    return morphgnt_events(verses, book_rows, record_bcv, EVENT_CODES)
+
+
+def iter_morphgnt_verses(verses, corpus=None):
+    """
+    yield events as iter_morphgnt does except that, in place of WORD events,
+    the words of each verse come all at once as a (WORDS, list of WordRecords)
+    event just before its VERSE_END.
+    """
+    words = []
+    append = words.append
+    for code, value in iter_morphgnt(verses, corpus):
+        if code == WORD:
+            append(value)
+            continue
+        if words:
+            yield WORDS, words
+            words = []
+            append = words.append
+        yield code, value
 
 
 def load_yaml(filename, wrapper=lambda key, metadata: metadata):
@@ -101,6 +335,60 @@ def load_yaml(filename, wrapper=lambda key, metadata: metadata):
         }
 
 
+class Lexicon(collections.abc.Mapping):
+    """
+    read-only mapping of lemma to lexicon entry where each entry is only
+    unmarshalled the first time it is looked up.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.entries = {}
+
+    def __getitem__(self, lemma):
+        try:
+            return self.entries[lemma]
+        except KeyError:
+            entry = self.entries[lemma] = marshal.loads(self.records[lemma])
+            return entry
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+
+def load_lexicon(filename):
+    """
+    returns a Lexicon for the given YAML lexicon file (e.g. lexemes.yaml).
+
+    the parsed entries are cached on disk so the YAML only needs to be parsed
+    again when the file changes.
+    """
+    return Lexicon(cached(
+        "lexicon-{}".format(os.path.basename(filename)), [filename],
+        lambda: {
+            lemma: marshal.dumps(entry)
+            for lemma, entry in load_yaml(filename).items()
+        }))
+
+
+class Memo(dict):
+    """
+    dict that computes the value for a missing key by calling func with the
+    key, remembering it for next time.
+    """
+
+    def __init__(self, func):
+        super().__init__()
+        self.func = func
+
+    def __missing__(self, key):
+        value = self[key] = self.func(key)
+        return value
+
+
 def load_wordset(filename):
     with open(filename) as f:
         return set([
@@ -110,14 +398,193 @@ def load_wordset(filename):
         )
 
 
+_collator = None
+
+
+def get_collator():
+    """
+    returns the UCA collator, only loading it (which is slow) on first use.
+    """
+    global _collator
+    if _collator is None:
+        _collator = Collator()
+    return _collator
+
+
+@functools.lru_cache(maxsize=None)
+def lexicon_sort_keys():
+    """
+    returns a dict mapping each lemma in lexemes.yaml to its UCA sort key.
+
+    the keys are computed once and cached on disk until the lexicon (or pyuca)
+    changes.
+    """
+    return cached(
+        "sort-keys", [LEXEMES, sys.modules[Collator.__module__].__file__],
+        lambda: {
+            lemma: tuple(get_collator().sort_key(lemma))
+            for lemma in load_lexicon(LEXEMES)
+        })
+
+
+@functools.lru_cache(maxsize=None)
+def sort_key(s):
+    key = lexicon_sort_keys().get(s)
+    if key is None:
+        key = tuple(get_collator().sort_key(s))
+    return key
+
+
 def sorted_items(d):
-    return sorted(d.items(), key=lambda x: collator.sort_key(x[0]))
+    if len(d) < 2:
+        # nothing to sort so don't compute any keys
+        return list(d.items())
+    return sorted(d.items(), key=lambda x: sort_key(x[0]))
 
 
 def print_status(s):
     print("\x1b[36m" + s + "\x1b[0m", file=sys.stderr)
 
 
+def max_rss():
+    """
+    returns the peak resident set size of this process in bytes (or None if
+    it can't be determined).
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def add_stats_arguments(argparser):
+    argparser.add_argument(
+        "--stats", action="store_true",
+        help="report the time spent in each stage, counts of what was "
+             "processed and peak memory use on stderr")
+    argparser.add_argument(
+        "--stats-json", help="file to write the --stats report to as JSON")
+    argparser.add_argument(
+        "--profile",
+        help="file to write a cProfile profile of the run to (view it with "
+             "python -m pstats)")
+
+
+class Stats:
+    """
+    the wall time spent in each stage of a run and counts of what was
+    processed, along with an optional cProfile profile of the whole run.
+
+    stages shouldn't overlap; any time not spent in one is reported as other.
+    timed and timer instrument individual items so should only be used when
+    enabled. a Stats that isn't enabled is false so code taking an optional
+    Stats can just check "if stats".
+    """
+
+    def __init__(self, enabled=True, profile=None):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.times = {}
+        self.counts = collections.Counter()
+        self.profile = profile
+        if profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def __bool__(self):
+        return bool(self.enabled)
+
+    def add_time(self, stage, seconds):
+        self.times[stage] = self.times.get(stage, 0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, name, iterable, count=None):
+        """
+        yield from the iterable, adding the time taken to produce each item to
+        the given stage and counting the items under count (if given).
+        """
+        clock = time.perf_counter
+        iterator = iter(iterable)
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, clock() - start)
+                return
+            self.add_time(name, clock() - start)
+            if count:
+                self.counts[count] += 1
+            yield item
+
+    def timer(self, name, func):
+        """
+        returns func wrapped to add the time spent in each call to the given
+        stage.
+        """
+        clock = time.perf_counter
+
+        def timed_func(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add_time(name, clock() - start)
+        return timed_func
+
+    def summary(self):
+        total = time.perf_counter() - self.start
+        stages = dict(self.times)
+        stages["other"] = max(total - sum(self.times.values()), 0)
+        summary = {
+            "seconds": total,
+            "stages": stages,
+            "counts": dict(self.counts),
+            "max_rss": max_rss(),
+        }
+        if self.counts["words"]:
+            summary["excluded_ratio"] = (
+                self.counts["excluded words"] / self.counts["words"])
+        return summary
+
+    def finish(self, filename=None):
+        """
+        writes the profile (if profiling) and, if enabled, reports the stats
+        on stderr or, if a filename is given, writes them to it as JSON.
+        """
+        if self.profile:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile)
+            print_status("wrote profile to {}".format(self.profile))
+        if not self.enabled:
+            return
+        summary = self.summary()
+        if filename:
+            with open(filename, "w") as f:
+                json.dump(summary, f, indent=2, sort_keys=True)
+                f.write("\n")
+            print_status("wrote stats to {}".format(filename))
+            return
+        for stage, seconds in summary["stages"].items():
+            print_status("{:9.3f}s {}".format(seconds, stage))
+        print_status("{:9.3f}s total".format(summary["seconds"]))
+        for name, count in sorted(summary["counts"].items()):
+            print_status("{:10} {}".format(count, name))
+        if "excluded_ratio" in summary:
+            print_status("{:9.1f}% of words excluded".format(
+                100 * summary["excluded_ratio"]))
+        if summary["max_rss"] is not None:
+            print_status("{:8.1f}MB peak RSS".format(
+                summary["max_rss"] / 1024 / 1024))
+
+
 BOOK_NAMES = [
     {"Mt", "Matt", "Matthew"},
     {"Mk", "Mark"},
@@ -154,96 +621,115 @@ for i, name_set in enumerate(BOOK_NAMES, 1):
     for name in name_set:
         BOOK_NAME_MAPPINGS[name] = i
 
-REF_RE = re.compile(r"""
-        (
-            (?P<book>({}))
-            \s
-            (
-                (
-                    (?P<chapter>\d+)
-                    :
-                    (?P<verse>\d+)
-                    $
-                )|(
-                    (?P<chapter1>\d+)
-                    :
-                    (?P<verse_start1>\d+)
-                    -
-                    (?P<verse_end1>\d+)
-                    $
-                )|(
-                    (?P<chapter_start2>\d+)
-                    :
-                    (?P<verse_start2>\d+)
-                    -
-                    (?P<chapter_end2>\d+)
-                    :
-                    (?P<verse_end2>\d+)
-                    $
-                )
-            )
-        )|(
-            (?P<book_start>({}))
-            \s
-            (?P<chapter_start>\d+)
-            :
-            (?P<verse_start>\d+)
-            -
-            (?P<book_end>({}))
-            \s
-            (?P<chapter_end>\d+)
-            :
-            (?P<verse_end>\d+)
-            $
-        )
-    """.format("|".join(BOOK_NAME_MAPPINGS.keys()),
-               "|".join(BOOK_NAME_MAPPINGS.keys()),
-               "|".join(BOOK_NAME_MAPPINGS.keys())),
-    re.VERBOSE
-)
+
+def parse_reference(s, book=None, chapter=None):
+    """
+    parses a single reference such as "John 18:1", "18:1" or "1" into a
+    (book, chapter, verse) tuple of ints, taking the book and chapter from
+    the given context if they are omitted.
+    """
+    book_name, _, ref = s.strip().rpartition(" ")
+    if book_name:
+        book = BOOK_NAME_MAPPINGS.get(book_name.strip())
+        if book is None or ":" not in ref:
+            raise ValueError("can't parse verses")
+    chapter_text, _, verse_text = ref.rpartition(":")
+    if chapter_text:
+        chapter = chapter_text
+    if book is None or chapter is None:
+        raise ValueError("can't parse verses")
+    try:
+        bcv = (book, int(chapter), int(verse_text))
+    except ValueError:
+        raise ValueError("can't parse verses")
+    if not all(0 <= i < 100 for i in bcv):
+        raise ValueError("can't parse verses")
+    return bcv
+
+
+@functools.lru_cache(maxsize=None)
+def book_verses(book_num):
+    """
+    returns a sorted list of the BBCCVVs in the given book number.
+    """
+    return sorted(verse_offsets(book_num))
+
+
+def verse_position(bcv):
+    """
+    returns the number of verses in MorphGNT before the given BBCCVV, so the
+    difference of two positions is the number of verses between them.
+    """
+    book_num = int(bcv[:2])
+    return sum(len(book_verses(i)) for i in range(1, book_num)) + \
+        bisect.bisect_left(book_verses(book_num), bcv)
+
+
+def next_verse(bcv):
+    """
+    returns the BBCCVV of the verse following the given one in MorphGNT or
+    None if there isn't one.
+    """
+    book_num = int(bcv[:2])
+    verses = book_verses(book_num)
+    i = bisect.bisect_right(verses, bcv)
+    if i < len(verses):
+        return verses[i]
+    elif book_num < 27:
+        return book_verses(book_num + 1)[0]
+
+
+def merge_verse_ranges(ranges):
+    """
+    sorts a list of (start, end) BBCCVV pairs and merges any that overlap or
+    are adjacent.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and (
+                start <= merged[-1][1] or start == next_verse(merged[-1][1])):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
 
 
 def parse_verse_ranges(s):
-    m = REF_RE.match(s)
-    if not m:
-        raise ValueError("can't parse verses")
+    """
+    parses a passage spec into a list of verse-ranges for get_morphgnt.
 
-    if m.groupdict()["book"]:
-        book_start = BOOK_NAME_MAPPINGS[m.groupdict()["book"]]
-        book_end = BOOK_NAME_MAPPINGS[m.groupdict()["book"]]
-        if m.groupdict()["chapter"]:
-            chapter_start = int(m.groupdict()["chapter"])
-            chapter_end = int(m.groupdict()["chapter"])
-            verse_start = int(m.groupdict()["verse"])
-            verse_end = int(m.groupdict()["verse"])
-        elif m.groupdict()["chapter1"]:
-            chapter_start = int(m.groupdict()["chapter1"])
-            chapter_end = int(m.groupdict()["chapter1"])
-            verse_start = int(m.groupdict()["verse_start1"])
-            verse_end = int(m.groupdict()["verse_end1"])
+    the spec is one or more references separated by commas or semicolons,
+    where each is a verse or a range of verses. the book, and the chapter of a
+    verse, can be left off when they are the same as the previous reference's.
+    e.g. "John 18:1-11; 19:1-16, Mk 14:32-52" or "John 3:16, 18".
+
+    the ranges are returned in canonical order with any that overlap or are
+    adjacent merged, and single verses are given as just a verse-id.
+    """
+    ranges = []
+    book = chapter = None
+    for fragment in s.replace(";", ",").split(","):
+        start_text, dash, end_text = fragment.partition("-")
+        if not start_text.strip() or (dash and not end_text.strip()):
+            raise ValueError("can't parse verses")
+        start = parse_reference(start_text, book, chapter)
+        book, chapter = start[:2]
+        if dash:
+            end = parse_reference(end_text, book, chapter)
+            book, chapter = end[:2]
         else:
-            chapter_start = int(m.groupdict()["chapter_start2"])
-            chapter_end = int(m.groupdict()["chapter_end2"])
-            verse_start = int(m.groupdict()["verse_start2"])
-            verse_end = int(m.groupdict()["verse_end2"])
-    elif m.groupdict()["book_start"]:
-        book_start = BOOK_NAME_MAPPINGS[m.groupdict()["book_start"]]
-        book_end = BOOK_NAME_MAPPINGS[m.groupdict()["book_end"]]
-        chapter_start = int(m.groupdict()["chapter_start"])
-        chapter_end = int(m.groupdict()["chapter_end"])
-        verse_start = int(m.groupdict()["verse_start"])
-        verse_end = int(m.groupdict()["verse_end"])
-
-    if (book_start, chapter_start, verse_start) != \
-       (book_end, chapter_end, verse_end):
-        return [(
-            "{:02d}{:02d}{:02d}".format(book_start, chapter_start, verse_start),
-            "{:02d}{:02d}{:02d}".format(book_end, chapter_end, verse_end),
-        )]
-    else:
-        return [
-            "{:02d}{:02d}{:02d}".format(book_start, chapter_start, verse_start)
-        ]
+            end = start
+        if end < start:
+            raise ValueError("can't parse verses")
+        ranges.append((
+            "{:02d}{:02d}{:02d}".format(*start),
+            "{:02d}{:02d}{:02d}".format(*end),
+        ))
+
+    return [
+        start if start == end else (start, end)
+        for start, end in merge_verse_ranges(ranges)
+    ]
 
 
 def load_path_attr(path):
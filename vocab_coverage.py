@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+"""
+Reports how much of every chapter of the New Testament one or more exclusion
+lists already cover, to help choose passages for a given learner.
+
+For each list and chapter it gives the fraction of the chapter's words (token
+coverage) and of its distinct lemmas (type coverage) that are in the list, and
+the number of lemmas that aren't (the new lemmas a reader of the chapter would
+have to gloss).
+
+The lemma id of every word is read from the corpus store into a NumPy array
+and each exclusion list becomes a boolean mask over the lemma ids, so all the
+chapters for all the lists are evaluated at once with array operations.
+"""
+
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from corpus import load_corpus
+from utils import (BOOK_NAMES, Stats, add_stats_arguments, load_wordset,
+                   print_status)
+
+
+def chapter_reference(bcc):
+    """
+    returns a human-readable reference (e.g. "John 18") for a packed BBCC int.
+    """
+    return "{} {}".format(max(BOOK_NAMES[bcc // 100 - 1], key=len), bcc % 100)
+
+
+class ChapterLemmas:
+    """
+    the lemma id of every word in the corpus grouped by chapter, along with
+    the distinct (chapter, lemma id) pairs.
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.lemmas = np.asarray(corpus.columns["lemma"])
+        chapters = np.asarray(corpus.bcv) // 100
+
+        # the corpus is in text order so each chapter is one run of rows
+        self.offsets = np.flatnonzero(np.diff(chapters, prepend=-1))
+        self.chapters = chapters[self.offsets]
+        self.tokens = np.diff(self.offsets, append=len(self.lemmas))
+
+        chapter_index = np.repeat(np.arange(len(self.chapters)), self.tokens)
+        num_strings = len(corpus.strings)
+        pairs = np.unique(
+            chapter_index.astype(np.int64) * num_strings + self.lemmas)
+        self.pair_lemmas = pairs % num_strings
+        self.types = np.bincount(
+            pairs // num_strings, minlength=len(self.chapters))
+        self.pair_offsets = np.concatenate(([0], np.cumsum(self.types)[:-1]))
+
+        self.lemma_ids = {
+            corpus.string(lemma_id): lemma_id
+            for lemma_id in np.unique(self.lemmas).tolist()
+        }
+
+    def masks(self, wordsets):
+        """
+        returns a boolean array with a row for each of the given sets of
+        lemmas which is true at the ids of the lemmas in the set.
+
+        lemmas that don't occur in the text are ignored.
+        """
+        masks = np.zeros((len(wordsets), len(self.corpus.strings)), dtype=bool)
+        for row, wordset in zip(masks, wordsets):
+            row[[
+                self.lemma_ids[lemma] for lemma in wordset
+                if lemma in self.lemma_ids
+            ]] = True
+        return masks
+
+    def coverage(self, wordsets):
+        """
+        returns a dict of arrays, each with a row for each of the given sets of
+        lemmas and a column for each chapter, of the words and distinct lemmas
+        in each chapter that are in the set, the token and type coverage as
+        fractions and the number of new (not in the set) lemmas.
+        """
+        masks = self.masks(wordsets)
+        known_tokens = np.add.reduceat(
+            masks[:, self.lemmas], self.offsets, axis=1, dtype=np.int64)
+        known_types = np.add.reduceat(
+            masks[:, self.pair_lemmas], self.pair_offsets, axis=1,
+            dtype=np.int64)
+        return {
+            "known_tokens": known_tokens,
+            "known_types": known_types,
+            "token_coverage": known_tokens / self.tokens,
+            "type_coverage": known_types / self.types,
+            "new_lemmas": self.types - known_types,
+        }
+
+
+def write_csv(out, names, chapter_lemmas, coverage):
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow([
+        "list", "chapter", "tokens", "types", "token_coverage",
+        "type_coverage", "new_lemmas",
+    ])
+    references = [
+        chapter_reference(bcc) for bcc in chapter_lemmas.chapters.tolist()]
+    tokens = chapter_lemmas.tokens.tolist()
+    types = chapter_lemmas.types.tolist()
+    for i, name in enumerate(names):
+        writer.writerows(zip(
+            [name] * len(references), references, tokens, types,
+            ("{:.4f}".format(x) for x in coverage["token_coverage"][i].tolist()),
+            ("{:.4f}".format(x) for x in coverage["type_coverage"][i].tolist()),
+            coverage["new_lemmas"][i].tolist(),
+        ))
+
+
+def write_json(out, names, chapter_lemmas, coverage):
+    json.dump({
+        "chapters": [
+            chapter_reference(bcc) for bcc in chapter_lemmas.chapters.tolist()],
+        "tokens": chapter_lemmas.tokens.tolist(),
+        "types": chapter_lemmas.types.tolist(),
+        "lists": {
+            name: {
+                key: np.round(values[i], 4).tolist()
+                if values.dtype.kind == "f" else values[i].tolist()
+                for key, values in coverage.items()
+            }
+            for i, name in enumerate(names)
+        },
+    }, out, ensure_ascii=False)
+    out.write("\n")
+
+
+FORMATS = {
+    "csv": write_csv,
+    "json": write_json,
+}
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "exclude", nargs="+", help="exclusion list file, any number of times")
+    argparser.add_argument(
+        "--format", choices=sorted(FORMATS), default="csv",
+        help="output format (defaults to csv)")
+    argparser.add_argument(
+        "--output", help="file to write the report to (defaults to stdout)")
+    add_stats_arguments(argparser)
+
+    args = argparser.parse_args()
+
+    stats = Stats(args.stats or bool(args.stats_json), args.profile)
+
+    with stats.stage("resources"):
+        wordsets = [load_wordset(filename) for filename in args.exclude]
+
+    with stats.stage("corpus"):
+        chapter_lemmas = ChapterLemmas(load_corpus())
+
+    with stats.stage("coverage"):
+        coverage = chapter_lemmas.coverage(wordsets)
+
+    stats.counts["lists"] = len(wordsets)
+    stats.counts["chapters"] = len(chapter_lemmas.chapters)
+    stats.counts["tokens"] = len(chapter_lemmas.lemmas)
+
+    with stats.stage("output"):
+        if args.output:
+            with open(args.output, "w") as out:
+                FORMATS[args.format](
+                    out, args.exclude, chapter_lemmas, coverage)
+        else:
+            FORMATS[args.format](
+                sys.stdout, args.exclude, chapter_lemmas, coverage)
+
+    print_status("evaluated {} exclusion lists over {} chapters".format(
+        len(wordsets), len(chapter_lemmas.chapters)))
+
+    stats.finish(args.stats_json)
+
+
+if __name__ == "__main__":
+    main()